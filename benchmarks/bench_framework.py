@@ -0,0 +1,410 @@
+"""
+Benchmarks for the overhead of the testbench framework itself.
+
+Generates synthetic registries, configurations and project trees in a temporary
+directory and measures the framework with no-op tools. Results are written to a
+JSON file so they can be compared between versions:
+
+    uv run python benchmarks/bench_framework.py --output bench.json
+    uv run python benchmarks/bench_framework.py --compare old.json new.json
+"""
+
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import yaml
+
+PRESETS = {
+    "quick": {
+        "repeat": 3,
+        "registry": [(10, 5), (50, 5)],
+        "tasks": [100, 500],
+        "parallel": 8,
+        "keys": [100, 1000],
+        "env": [10, 100],
+        "spawn": 10,
+    },
+    "full": {
+        "repeat": 5,
+        "registry": [(10, 10), (50, 10), (100, 10)],
+        "tasks": [100, 1000, 5000],
+        "parallel": 8,
+        "keys": [100, 1000, 10000],
+        "env": [10, 100, 500],
+        "spawn": 50,
+    },
+}
+
+FS_MODULE = """from pathlib import Path
+from typing import Optional
+
+
+def get_from_dir(path: Path, extension: str, name: Optional[str] = None) -> Path:
+    if name is not None:
+        return Path(path) / name
+    return next(Path(path).glob(f"*.{extension}"))
+"""
+
+# Tools subclass Tool directly, a type base class would have to be imported
+# from the registry package, which differs between the generated registries
+TOOL_MODULE = """from testbench import Task, Tool
+
+
+class {cls}(Tool):
+    def __init__(self, task: Task, params: dict, env: dict):
+        super().__init__("{type}", "{name}", task, params, env)
+
+    def noop(self) -> None:
+        pass
+"""
+
+FILE_MODULE = """from pathlib import Path
+from typing import Optional
+
+from testbench import File
+
+
+class Text(File):
+    def __init__(
+        self, path: Path, configs: dict, output_dir: Path, name: Optional[str] = None
+    ):
+        super().__init__(path, "txt", configs, output_dir, name)
+"""
+
+
+# ----------------------------------------------------------------------
+# Generators
+
+
+def generate_registry(root: Path, tool_types: int, tools_per_type: int) -> None:
+    common_dir = root / "registry" / "common"
+    common_dir.mkdir(parents=True, exist_ok=True)
+    (root / "registry" / "__init__.py").touch()
+    (common_dir / "__init__.py").touch()
+    (common_dir / "fs.py").write_text(FS_MODULE)
+
+    files_dir = root / "registry" / "files"
+    files_dir.mkdir(parents=True, exist_ok=True)
+    (files_dir / "file_text.py").write_text(FILE_MODULE)
+
+    for i in range(tool_types):
+        tool_type = f"noop{i}"
+        type_dir = root / "registry" / "tools" / tool_type
+        type_dir.mkdir(parents=True, exist_ok=True)
+        for j in range(tools_per_type):
+            (type_dir / f"{tool_type}_t{j}.py").write_text(
+                TOOL_MODULE.format(cls=f"Noop{i}T{j}", type=tool_type, name=f"t{j}")
+            )
+
+
+def generate_config(
+    root: Path, name: str, tasks: int, parallel: int, tool_types: int = 1
+) -> Path:
+    project = root / "project"
+    project.mkdir(exist_ok=True)
+
+    config = {
+        "registry": {"tools": "registry/tools", "files": "registry/files"},
+        "tasks": {},
+        "schedule": {},
+    }
+    for i in range(tasks):
+        tool_type = f"noop{i % tool_types}"
+        config["tasks"][f"task{i}"] = {
+            "path": str(project),
+            "tools": {tool_type: {"t0": None}},
+        }
+        config["schedule"][f"task{i}"] = {
+            "order": i // parallel + 1,
+            "steps": {"noop": f"{tool_type};t0"},
+        }
+
+    # Keep the testbench from picking up a `.env` outside of the generated tree
+    (root / ".env").touch()
+
+    config_path = root / "config" / f"{name}.yml"
+    config_path.parent.mkdir(exist_ok=True)
+    with open(config_path, "w") as f:
+        yaml.dump(config, f, default_flow_style=False)
+    return config_path
+
+
+def generate_text(root: Path, keys: int) -> tuple[Path, dict]:
+    project = root / "project"
+    project.mkdir(exist_ok=True)
+
+    path = project / f"keys_{keys}.txt"
+    with open(path, "w") as f:
+        for i in range(keys):
+            f.write(f"#define VALUE_{i:06d} KEY_{i:06d}\n")
+
+    return path, {f"KEY_{i:06d}": str(i) for i in range(keys)}
+
+
+def generate_env(root: Path, variables: int) -> Path:
+    path = root / f"env_{variables}.env"
+    with open(path, "w") as f:
+        for i in range(variables):
+            f.write(f"VAR_{i}={root}/value_{i}\n")
+    return path
+
+
+# ----------------------------------------------------------------------
+# Measurements
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        "mean": statistics.mean(samples),
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "samples": len(samples),
+    }
+
+
+def summarize_phases(runs: list[dict[str, float]]) -> dict:
+    return {phase: summarize([run[phase] for run in runs]) for phase in runs[0]}
+
+
+def bench_registry(root: Path, preset: dict) -> list[dict]:
+    from testbench import Testbench
+
+    results = []
+    for tool_types, tools_per_type in preset["registry"]:
+        case_root = root / f"registry_{tool_types}x{tools_per_type}"
+        case_root.mkdir()
+        generate_registry(case_root, tool_types, tools_per_type)
+        config_path = generate_config(case_root, "testbench", 1, 1)
+
+        runs = []
+        os.chdir(case_root)
+        for i in range(preset["repeat"]):
+            tb = Testbench(
+                config_path, case_root / "output" / str(i), case_root / ".env"
+            )
+            runs.append(tb.get_timings())
+
+        results.append(
+            {
+                "tool_types": tool_types,
+                "tools_per_type": tools_per_type,
+                "phases": summarize_phases(runs),
+            }
+        )
+    return results
+
+
+def bench_tasks(root: Path, preset: dict) -> list[dict]:
+    from testbench import Testbench
+
+    case_root = root / "tasks"
+    case_root.mkdir()
+    generate_registry(case_root, 1, 1)
+    os.chdir(case_root)
+
+    results = []
+    for tasks in preset["tasks"]:
+        for parallel in sorted({1, preset["parallel"]}):
+            config_path = generate_config(
+                case_root, f"tasks_{tasks}_{parallel}", tasks, parallel
+            )
+
+            runs = []
+            for i in range(preset["repeat"]):
+                output = case_root / "output" / f"{tasks}_{parallel}_{i}"
+                tb = Testbench(config_path, output, case_root / ".env")
+                tb.initialize_tasks()
+
+                start = time.perf_counter()
+                iterations = 0
+                while not tb.is_done():
+                    tb.iterate()
+                    iterations += 1
+                timings = tb.get_timings()
+                timings["iterate"] = time.perf_counter() - start
+                timings["iterate_per_task"] = timings["iterate"] / tasks
+                runs.append(timings)
+
+            results.append(
+                {
+                    "tasks": tasks,
+                    "parallel": parallel,
+                    "orders": iterations,
+                    "phases": summarize_phases(runs),
+                }
+            )
+    return results
+
+
+def bench_files(root: Path, preset: dict) -> list[dict]:
+    from testbench.file import File
+
+    case_root = root / "files"
+    case_root.mkdir()
+
+    results = []
+    for keys in preset["keys"]:
+        path, configs = generate_text(case_root, keys)
+        original = path.read_text()
+
+        samples = []
+        for i in range(preset["repeat"]):
+            start = time.perf_counter()
+            output = case_root / "output" / str(i)
+            file = File(path.parent, "txt", configs, output, path.name)
+            samples.append(time.perf_counter() - start)
+            del file
+            path.write_text(original)
+
+        results.append(
+            {
+                "keys": keys,
+                "bytes": len(original),
+                "construct": summarize(samples),
+                "keys_per_second": keys / statistics.median(samples),
+            }
+        )
+    return results
+
+
+def bench_env(root: Path, preset: dict) -> list[dict]:
+    from testbench import Testbench
+
+    case_root = root / "env"
+    case_root.mkdir()
+    generate_registry(case_root, 1, 1)
+    config_path = generate_config(case_root, "testbench", 100, 1)
+    os.chdir(case_root)
+
+    results = []
+    for variables in preset["env"]:
+        env_path = generate_env(case_root, variables)
+
+        runs = []
+        for i in range(preset["repeat"]):
+            output = case_root / "output" / f"{variables}_{i}"
+            runs.append(Testbench(config_path, output, env_path).get_timings())
+
+        results.append({"variables": variables, "phases": summarize_phases(runs)})
+    return results
+
+
+def bench_spawn(root: Path, preset: dict) -> dict:
+    from testbench import Task, Tool
+
+    case_root = root / "spawn"
+    case_root.mkdir()
+
+    task = Task("spawn", case_root, case_root / "output", {}, {})
+    tool = Tool("noop", "spawn", task, {}, {})
+
+    samples = []
+    for _ in range(preset["spawn"]):
+        start = time.perf_counter()
+        tool.run_command("exit 0", "spawn")
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples)
+
+
+BENCHMARKS = {
+    "registry": bench_registry,
+    "tasks": bench_tasks,
+    "files": bench_files,
+    "env": bench_env,
+    "spawn": bench_spawn,
+}
+
+
+# ----------------------------------------------------------------------
+# Entry points
+
+
+def run(preset_name: str, selected: list[str]) -> dict:
+    preset = PRESETS[preset_name]
+    cwd = Path.cwd()
+
+    results = {
+        "preset": preset_name,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="testbench-bench-") as tmp:
+        root = Path(tmp)
+        # File imports `registry.common.fs` from the project using the testbench
+        generate_registry(root, 0, 0)
+        sys.path.insert(0, str(root))
+
+        try:
+            for name in selected:
+                print(f"Running benchmark: {name}", file=sys.stderr)
+                start = time.perf_counter()
+                results["benchmarks"][name] = BENCHMARKS[name](root, preset)
+                print(
+                    f"Done ({time.perf_counter() - start:.2f}s): {name}",
+                    file=sys.stderr,
+                )
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(str(root))
+
+    return results
+
+
+def compare(old: dict, new: dict, prefix: str = "") -> list[str]:
+    lines = []
+    for key, value in new.items():
+        if key not in old:
+            continue
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            if "median" in value and "median" in old[key]:
+                before, after = old[key]["median"], value["median"]
+                change = (after - before) / before * 100 if before else 0.0
+                lines.append(f"{change:+8.1f}%  {before:.6f}s -> {after:.6f}s  {path}")
+            else:
+                lines += compare(old[key], value, path)
+        elif isinstance(value, list):
+            for i, (a, b) in enumerate(zip(old[key], value)):
+                if isinstance(a, dict) and isinstance(b, dict):
+                    lines += compare(a, b, f"{path}[{i}]")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--preset", choices=PRESETS, default="quick")
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS)
+    )
+    parser.add_argument("--output", type=Path, default=Path("bench.json"))
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print("\n".join(compare(old["benchmarks"], new["benchmarks"])))
+        return
+
+    results = run(args.preset, args.only)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote results to '{args.output}'", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
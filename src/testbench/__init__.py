@@ -1,9 +1,19 @@
+from .batch import TestbenchBatch
+from .binary import BinaryFile, HexFile
 from .file import File
+from .model import Step, Task
+from .planner import TestbenchPlanner
 from .testbench import Testbench
 from .tool import Tool
 
 __all__ = [
+    "BinaryFile",
     "File",
+    "HexFile",
+    "Step",
+    "Task",
     "Testbench",
+    "TestbenchBatch",
+    "TestbenchPlanner",
     "Tool",
 ]
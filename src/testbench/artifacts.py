@@ -0,0 +1,94 @@
+from pathlib import Path
+import asyncio
+import threading
+from typing import Optional
+import logging
+
+
+class TestbenchArtifacts:
+    """
+    Named files published by steps and consumed by steps of other tasks.
+
+    Artifacts are shared by reference: the run directory only gets a link to
+    the published file in `artifacts/`, the file itself is never copied.
+    """
+
+    def __init__(self, output_dir: Optional[Path] = None):
+        self.log = logging.getLogger("artifacts")
+
+        self.__output_dir = output_dir
+        self.__condition = threading.Condition()
+        self.__published: dict[str, Path] = {}
+        self.__failed: dict[str, str] = {}
+        self.__waiters: dict[
+            str, list[tuple[asyncio.AbstractEventLoop, asyncio.Future]]
+        ] = {}
+
+    def publish(self, name: str, path: Path) -> None:
+        path = Path(path).absolute()
+        if not path.exists():
+            raise FileNotFoundError(f'Artifact "{name}" does not exist at "{path}"')
+
+        if self.__output_dir is not None:
+            self.__output_dir.mkdir(parents=True, exist_ok=True)
+            link = self.__output_dir / name
+            try:
+                link.unlink(missing_ok=True)
+                link.symlink_to(path, target_is_directory=path.is_dir())
+            except OSError as e:
+                self.log.debug(f'Could not link artifact "{name}": {e}')
+
+        with self.__condition:
+            self.__published[name] = path
+            self.__condition.notify_all()
+            self.__wake(name)
+        self.log.info(f'Published artifact "{name}": {path}')
+
+    def fail(self, name: str, reason: str) -> None:
+        with self.__condition:
+            if name in self.__published or name in self.__failed:
+                return
+            self.__failed[name] = reason
+            self.__condition.notify_all()
+            self.__wake(name)
+        self.log.warning(f'Artifact "{name}" not published: {reason}')
+
+    def __wake(self, name: str) -> None:
+        for loop, future in self.__waiters.pop(name, []):
+            loop.call_soon_threadsafe(self.__resolve, name, future)
+
+    def __resolve(self, name: str, future: asyncio.Future) -> None:
+        if future.done():
+            return
+        try:
+            future.set_result(self.get(name))
+        except Exception as e:
+            future.set_exception(e)
+
+    def is_ready(self, name: str) -> bool:
+        return name in self.__published or name in self.__failed
+
+    def get(self, name: str) -> Path:
+        if name in self.__failed:
+            raise Exception(f'Artifact "{name}" not available: {self.__failed[name]}')
+        if name not in self.__published:
+            raise KeyError(f'Artifact "{name}" has not been published')
+        return self.__published[name]
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Path:
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.is_ready(name), timeout):
+                raise TimeoutError(f'Timed out waiting for artifact "{name}"')
+            return self.get(name)
+
+    async def wait_async(self, name: str) -> Path:
+        with self.__condition:
+            if self.is_ready(name):
+                return self.get(name)
+
+            future = asyncio.get_running_loop().create_future()
+            self.__waiters.setdefault(name, []).append(
+                (asyncio.get_running_loop(), future)
+            )
+
+        return await future
@@ -0,0 +1,105 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from typing import Optional
+import logging
+
+from .cache import TestbenchCache
+from .testbench import Testbench
+
+
+class TestbenchBatch:
+    """
+    Runs several testbench configurations in one process.
+
+    Registries and `!inc` files are loaded once, every run gets its own output
+    directory `<output_dir>/<name>/<timestamp>` and the blocking steps of all
+    runs share one worker pool.
+    """
+
+    def __init__(
+        self,
+        config_paths: list[Path | str] | dict[str, Path | str],
+        output_dir: Optional[Path | str] = None,
+        env_path: Optional[Path | str] = None,
+        workers: Optional[int] = None,
+    ):
+        self.log = logging.getLogger("batch")
+
+        if not isinstance(config_paths, dict):
+            config_paths = self.__names([Path(p) for p in config_paths])
+
+        self.__output_dir = Path(output_dir) if output_dir else Path("output")
+        self.__cache = TestbenchCache()
+        self.__executor = ThreadPoolExecutor(workers, thread_name_prefix="batch")
+
+        self.__testbenches: dict[str, Testbench] = {}
+        for name, config_path in config_paths.items():
+            self.log.info(f"Loading run: {name}")
+            try:
+                self.__testbenches[name] = Testbench(
+                    config_path,
+                    self.__output_dir / name,
+                    env_path,
+                    cache=self.__cache,
+                    executor=self.__executor,
+                )
+            except Exception as e:
+                raise ValueError(f"Error setting up run {name}: {e}") from e
+
+        self.log.info(f"Initialized batch with {len(self.__testbenches)} runs")
+
+    @staticmethod
+    def __names(config_paths: list[Path]) -> dict[str, Path]:
+        names = {}
+        for config_path in config_paths:
+            name = config_path.stem
+            suffix = 1
+            while name in names:
+                suffix += 1
+                name = f"{config_path.stem}-{suffix}"
+            names[name] = config_path
+        return names
+
+    def initialize_tasks(self) -> None:
+        for name, testbench in self.__testbenches.items():
+            self.log.debug(f"Initializing run: {name}")
+            testbench.initialize_tasks()
+
+    async def run_async(self) -> dict[str, Optional[BaseException]]:
+        names = list(self.__testbenches)
+        results = await asyncio.gather(
+            *(self.__testbenches[name].run() for name in names),
+            return_exceptions=True,
+        )
+
+        errors: dict[str, Optional[BaseException]] = {}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                self.log.error(f"Run {name} failed: {result}")
+                errors[name] = result
+            elif result:
+                errors[name] = Exception(f"Failed tasks: {', '.join(result)}")
+                self.log.error(f"Run {name} failed: {errors[name]}")
+            else:
+                errors[name] = None
+
+        return errors
+
+    def run(self) -> dict[str, Optional[BaseException]]:
+        return asyncio.run(self.run_async())
+
+    def restore_files(self) -> None:
+        for testbench in self.__testbenches.values():
+            testbench.restore_files()
+
+    def __enter__(self) -> "TestbenchBatch":
+        return self
+
+    def __exit__(self, *args) -> None:
+        for testbench in self.__testbenches.values():
+            testbench.__exit__(*args)
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def get(self) -> dict[str, Testbench]:
+        return self.__testbenches
@@ -0,0 +1,346 @@
+from pathlib import Path
+from bisect import bisect_right
+from functools import reduce
+import binascii
+import mmap
+import time
+import zlib
+from typing import Optional
+import logging
+
+from registry.common.fs import get_from_dir
+
+from .file import File
+from .journal import FileJournal, revert_bytes
+
+CHECKSUMS = {
+    "crc32": (4, lambda data: zlib.crc32(data)),
+    "crc16": (2, lambda data: binascii.crc_hqx(data, 0xFFFF)),
+    "sum8": (1, lambda data: sum(data) & 0xFF),
+    "sum16": (2, lambda data: sum(data) & 0xFFFF),
+    "xor8": (1, lambda data: reduce(int.__xor__, data, 0)),
+}
+
+
+class BinaryFile(File):
+    """
+    Patches regions of a binary image in place through a memory map.
+
+    Each config is a region, addressed by `address`, `offset` (relative to
+    `base_address`) or `symbol`, with either a `value` or a `checksum` over a
+    `range` of addresses. Checksums are computed after all values are patched.
+    Only the touched pages are written back.
+    """
+
+    base_address = 0
+    fill = 0xFF
+
+    def __init__(
+        self,
+        path: Path,
+        extension: str,
+        configs: dict,
+        output_dir: Path,
+        name: Optional[str] = None,
+    ):
+        self.configs = configs
+        self.name = name
+
+        self.log = logging.getLogger(f"file.{self.name}")
+
+        self.file = get_from_dir(path, extension, self.name)
+
+        self.output_dir = output_dir / "files"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        self.__journal = FileJournal.current()
+        self.__changes: list[tuple[int, bytes, bytes]] = []
+        self.__symbols: Optional[dict[str, int]] = None
+
+        self.patches: list[dict] = []
+        with open(self.file, "r+b") as f, mmap.mmap(f.fileno(), 0) as self.image:
+            self.index()
+            self.parse()
+            self.__patch()
+        self.image = None
+
+    # ------------------------------------------------------------------
+    # Image access, overridden for other image formats
+
+    def index(self) -> None:
+        pass
+
+    def read(self, address: int, size: int) -> bytes:
+        offset = address - self.base_address
+        if offset < 0 or offset + size > len(self.image):
+            raise ValueError(
+                f"Region 0x{address:08X}+{size} outside of image '{self.file}'"
+            )
+        return self.image[offset : offset + size]
+
+    def encode(self, overlay: dict[int, int]) -> list[tuple[int, bytes, bytes]]:
+        """
+        Turn patched bytes by address into file changes (offset, old, new).
+        """
+        changes = []
+        for start, data in self.runs(overlay):
+            old = self.read(start, len(data))
+            if old != data:
+                changes.append((start - self.base_address, old, data))
+        return changes
+
+    @staticmethod
+    def runs(overlay: dict[int, int]) -> list[tuple[int, bytes]]:
+        runs = []
+        for address in sorted(overlay):
+            if runs and runs[-1][0] + len(runs[-1][1]) == address:
+                runs[-1][1].append(overlay[address])
+            else:
+                runs.append((address, bytearray([overlay[address]])))
+        return [(start, bytes(data)) for start, data in runs]
+
+    # ------------------------------------------------------------------
+
+    def symbols(self) -> dict[str, int]:
+        """
+        Symbol addresses from the `symbols` config, either a mapping or the path
+        to a symbol table in `nm` format, relative to the image.
+        """
+        if self.__symbols is not None:
+            return self.__symbols
+
+        self.__symbols = {}
+        symbols = self.configs.get("symbols", {})
+        if isinstance(symbols, dict):
+            self.__symbols = {k: int(v) for k, v in symbols.items()}
+        else:
+            with open(self.file.parent / symbols, "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        self.__symbols[fields[-1]] = int(fields[0], 16)
+
+        return self.__symbols
+
+    def parse(self) -> None:
+        for key, spec in self.configs.items():
+            if key == "symbols":
+                continue
+            if not isinstance(spec, dict):
+                raise ValueError(f'Region "{key}" of "{self.file}" must be a mapping')
+
+            if "address" in spec:
+                address = spec["address"]
+            elif "offset" in spec:
+                address = self.base_address + spec["offset"]
+            elif "symbol" in spec:
+                if spec["symbol"] not in self.symbols():
+                    raise KeyError(f'Symbol "{spec["symbol"]}" not found for "{key}"')
+                address = self.symbols()[spec["symbol"]]
+            else:
+                raise KeyError(f'No address, offset or symbol for region "{key}"')
+
+            endian = spec.get("endian", "little")
+            if "checksum" in spec:
+                if spec["checksum"] not in CHECKSUMS:
+                    raise ValueError(f'Unknown checksum "{spec["checksum"]}"')
+                if "range" not in spec:
+                    raise KeyError(f'No range for checksum region "{key}"')
+                size, _ = CHECKSUMS[spec["checksum"]]
+                self.patches.append(
+                    {
+                        "key": key,
+                        "address": address,
+                        "size": spec.get("size", size),
+                        "checksum": spec["checksum"],
+                        "range": tuple(spec["range"]),
+                        "endian": endian,
+                    }
+                )
+                continue
+
+            if "value" not in spec:
+                raise KeyError(f'No value or checksum for region "{key}"')
+            value = spec["value"]
+            size = spec.get("size")
+            if isinstance(value, int):
+                if size is None:
+                    raise KeyError(f'No size for integer region "{key}"')
+                data = value.to_bytes(size, endian, signed=value < 0)
+            elif isinstance(value, str):
+                data = value.encode()
+            else:
+                data = bytes(value)
+
+            size = size if size is not None else len(data)
+            if len(data) > size:
+                raise ValueError(f'Value of region "{key}" exceeds {size} bytes')
+            data = data.ljust(size, b"\0")
+
+            self.patches.append(
+                {"key": key, "address": address, "size": size, "data": data}
+            )
+
+    def __read_patched(self, overlay: dict[int, int], start: int, end: int) -> bytes:
+        data = bytearray(self.read(start, end - start))
+        for address, value in overlay.items():
+            if start <= address < end:
+                data[address - start] = value
+        return bytes(data)
+
+    def __patch(self) -> None:
+        overlay: dict[int, int] = {}
+        for patch in self.patches:
+            if "data" in patch:
+                patch["old"] = self.read(patch["address"], patch["size"])
+                for i, value in enumerate(patch["data"]):
+                    overlay[patch["address"] + i] = value
+
+        for patch in self.patches:
+            if "checksum" in patch:
+                start, end = patch["range"]
+                _, algorithm = CHECKSUMS[patch["checksum"]]
+                checksum = algorithm(self.__read_patched(overlay, start, end))
+                patch["old"] = self.read(patch["address"], patch["size"])
+                patch["data"] = checksum.to_bytes(patch["size"], patch["endian"])
+                for i, value in enumerate(patch["data"]):
+                    overlay[patch["address"] + i] = value
+
+        self.__changes = self.encode(overlay)
+        if not self.__changes:
+            return
+
+        if self.__journal is not None:
+            self.__journal.write_bytes(self.file, self.__changes)
+
+        # Write only the touched pages back to disk
+        pages = set()
+        for offset, _, new in self.__changes:
+            self.image[offset : offset + len(new)] = new
+            first = offset - offset % mmap.ALLOCATIONGRANULARITY
+            for page in range(first, offset + len(new), mmap.ALLOCATIONGRANULARITY):
+                pages.add(page)
+        for page in sorted(pages):
+            size = min(mmap.ALLOCATIONGRANULARITY, len(self.image) - page)
+            self.image.flush(page, size)
+
+        self.log.debug(
+            f"Patched {len(self.__changes)} regions in {len(pages)} pages of '{self.file}'"
+        )
+
+        with open(self.output_dir / f"{self.file.name}.patch", "w") as f:
+            f.write(f"patch\nfile: {self.file}\n")
+            f.write(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write("-" * 45 + "\n\n")
+            for patch in self.patches:
+                f.write(
+                    f"{patch['key']}: 0x{patch['address']:08X} "
+                    f"{patch['old'].hex()} -> {patch['data'].hex()}\n"
+                )
+
+    def restore(self) -> None:
+        if self.__journal is not None:
+            self.__journal.restore(self.file)
+        elif self.__changes:
+            if not revert_bytes(self.file, self.__changes):
+                self.log.warning(f"Cannot restore '{self.file}', changed externally")
+            self.__changes = []
+
+    def __del__(self) -> None:
+        # Files in transaction mode are restored explicitly or by the journal
+        if getattr(self, "_BinaryFile__journal", None) is not None:
+            return
+
+        try:
+            self.restore()
+        except Exception:
+            pass  # Ignore errors during cleanup
+
+
+class HexFile(BinaryFile):
+    """
+    Patches an Intel HEX image in place, rewriting the affected data records
+    including their record checksums.
+    """
+
+    def index(self) -> None:
+        self.__records: list[tuple[int, int, int]] = []  # address, length, offset
+        base = 0
+
+        offset = 0
+        size = len(self.image)
+        while offset < size:
+            start = self.image.find(b":", offset)
+            if start < 0:
+                break
+            end = self.image.find(b"\n", start)
+            end = size if end < 0 else end
+            record = bytes.fromhex(self.image[start + 1 : end].strip().decode())
+            length, address, kind = record[0], int.from_bytes(record[1:3]), record[3]
+
+            match kind:
+                case 0x00:
+                    self.__records.append((base + address, length, start))
+                case 0x02:
+                    base = int.from_bytes(record[4:6]) << 4
+                case 0x04:
+                    base = int.from_bytes(record[4:6]) << 16
+                case 0x01:
+                    break
+
+            offset = end + 1
+
+        self.__records.sort()
+        self.__addresses = [record[0] for record in self.__records]
+
+    def __record(self, address: int) -> Optional[tuple[int, int, int]]:
+        i = bisect_right(self.__addresses, address) - 1
+        if i >= 0:
+            record = self.__records[i]
+            if address < record[0] + record[1]:
+                return record
+        return None
+
+    def __decode(self, record: tuple[int, int, int]) -> bytearray:
+        _, length, offset = record
+        return bytearray(
+            bytes.fromhex(self.image[offset + 1 : offset + 11 + 2 * length].decode())
+        )
+
+    def read(self, address: int, size: int) -> bytes:
+        data = bytearray([self.fill] * size)
+        i = max(bisect_right(self.__addresses, address) - 1, 0)
+        while i < len(self.__records) and self.__records[i][0] < address + size:
+            record = self.__records[i]
+            raw = self.__decode(record)[4:-1]
+            for j, value in enumerate(raw):
+                if address <= record[0] + j < address + size:
+                    data[record[0] + j - address] = value
+            i += 1
+        return bytes(data)
+
+    def encode(self, overlay: dict[int, int]) -> list[tuple[int, bytes, bytes]]:
+        records: dict[tuple[int, int, int], bytearray] = {}
+        for address, value in overlay.items():
+            record = self.__record(address)
+            if record is None:
+                raise ValueError(
+                    f"Address 0x{address:08X} not covered by image '{self.file}'"
+                )
+            if record not in records:
+                records[record] = self.__decode(record)
+            records[record][4 + address - record[0]] = value
+
+        changes = []
+        for record, raw in records.items():
+            _, length, offset = record
+            raw[-1] = -sum(raw[:-1]) & 0xFF
+
+            old = self.image[offset + 1 : offset + 11 + 2 * length]
+            new = raw.hex().encode()
+            if not old.islower():
+                new = new.upper()
+            if old != new:
+                changes.append((offset + 1, old, new))
+
+        return changes
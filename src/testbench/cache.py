@@ -0,0 +1,58 @@
+from pathlib import Path
+import copy
+import os
+import threading
+from typing import Any
+import logging
+
+import yaml
+import yaml_include
+
+from .tools import TestbenchTools
+from .files import TestbenchFiles
+
+
+class TestbenchCache:
+    """
+    Shares discovered registries and parsed `!inc` files between testbenches
+    created in the same process.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger("cache")
+
+        self.__lock = threading.Lock()
+        self.__tools: dict[Path, dict] = {}
+        self.__files: dict[Path, dict] = {}
+        self.__includes: dict[tuple[str, str], Any] = {}
+        self.__constructor = yaml_include.Constructor()
+
+    def tools(self, root: Path) -> dict:
+        with self.__lock:
+            if root not in self.__tools:
+                self.__tools[root] = TestbenchTools(root).get()
+            else:
+                self.log.debug(f"Using cached tools registry: '{root}'")
+            return self.__tools[root]
+
+    def files(self, root: Path) -> dict:
+        with self.__lock:
+            if root not in self.__files:
+                self.__files[root] = TestbenchFiles(root).get()
+            else:
+                self.log.debug(f"Using cached files registry: '{root}'")
+            return self.__files[root]
+
+    def include(self, loader: yaml.SafeLoader, node: yaml.Node) -> Any:
+        if not isinstance(node, yaml.ScalarNode):
+            return self.__constructor(loader, node)
+
+        # Relative includes are resolved against the working directory
+        key = (os.getcwd(), node.value)
+        if key not in self.__includes:
+            self.__includes[key] = self.__constructor(loader, node)
+        else:
+            self.log.debug(f"Using cached include: '{node.value}'")
+
+        # The testbench modifies its configuration in place
+        return copy.deepcopy(self.__includes[key])
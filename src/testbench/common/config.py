@@ -17,3 +17,17 @@ def load_config(config_path: Path | str) -> tuple[Path, dict]:
         raise ValueError("Configuration could not be loaded")
 
     return config_path, config
+
+
+def replace_env(obj, env: dict):
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            obj[key] = replace_env(value, env)
+    elif isinstance(obj, list):
+        for i, value in enumerate(obj):
+            obj[i] = replace_env(value, env)
+    elif isinstance(obj, str):
+        for key, value in env.items():
+            obj = obj.replace(f"<{key.lower()}>", value)
+
+    return obj
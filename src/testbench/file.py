@@ -1,10 +1,13 @@
 from pathlib import Path
+import difflib
 import shutil
 from typing import Optional
 import logging
 
 from registry.common.fs import get_from_dir
 
+from .journal import FileJournal, read_lines
+
 
 class File:
     def __init__(
@@ -24,19 +27,29 @@ class File:
 
         self.file = get_from_dir(self.__path, self.__extension, self.name)
 
-        # Make backup of original file
-        self.__file_backup = self.file.with_suffix(".bak")
-        shutil.copyfile(self.file, self.__file_backup)
+        self.output_dir = output_dir / "files"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        # In transaction mode, the file is rewritten atomically and only the
+        # changed lines are journaled instead of keeping a full backup
+        self.__journal = FileJournal.current()
+        self.__file_backup = None
+
+        if self.__journal is None:
+            # Make backup of original file
+            self.__file_backup = self.file.with_suffix(".bak")
+            shutil.copyfile(self.file, self.__file_backup)
 
         self.replacements = {}
         self.parse()
         self.__replace()
 
-        self.output_dir = output_dir / "files"
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        # Copy current file to output directory
-        shutil.copyfile(self.file, self.output_dir / self.file.name)
-        shutil.copyfile(self.__file_backup, self.output_dir / self.__file_backup.name)
+        if self.__journal is None:
+            # Copy current file to output directory
+            shutil.copyfile(self.file, self.output_dir / self.file.name)
+            shutil.copyfile(
+                self.__file_backup, self.output_dir / self.__file_backup.name
+            )
 
     def parse(self) -> None:
         with open(self.file, "r") as f:
@@ -49,20 +62,58 @@ class File:
                         self.replacements[key].append((i, self.configs[key.strip()]))
 
     def __replace(self) -> None:
+        if self.__journal is None:
+            with open(self.file, "r") as f:
+                original = f.readlines()
+        else:
+            original = read_lines(self.file)
+
         lines = []
-        with open(self.file, "r") as f:
-            for i, line in enumerate(f):
-                for key, replacements in self.replacements.items():
-                    for line_num, value in replacements:
-                        if i == line_num:
-                            line = line.replace(key.strip(), value.strip())
+        for i, line in enumerate(original):
+            for key, replacements in self.replacements.items():
+                for line_num, value in replacements:
+                    if i == line_num:
+                        line = line.replace(key.strip(), value.strip())
+
+            lines.append(line)
+
+        if self.__journal is None:
+            with open(self.file, "w") as f:
+                f.writelines(lines)
+            return
+
+        if not self.__journal.write(self.file, original, lines):
+            return
 
-                lines.append(line)
+        # Store a diff of the changed lines instead of both full copies
+        with open(self.output_dir / f"{self.file.name}.diff", "w") as f:
+            f.writelines(
+                difflib.unified_diff(
+                    original,
+                    lines,
+                    fromfile=f"{self.file} (original)",
+                    tofile=f"{self.file}",
+                    n=0,
+                )
+            )
 
-        with open(self.file, "w") as f:
-            f.writelines(lines)
+    def restore(self) -> None:
+        if self.__journal is not None:
+            self.__journal.restore(self.file)
+        elif self.__file_backup is not None and self.__file_backup.exists():
+            self.__file_backup.replace(self.file)
+
+    def __enter__(self) -> "File":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.restore()
 
     def __del__(self) -> None:
+        # Files in transaction mode are restored explicitly or by the journal
+        if getattr(self, "_File__journal", None) is not None:
+            return
+
         try:
             self.__file_backup.replace(self.file)
         except Exception:
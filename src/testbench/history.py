@@ -0,0 +1,93 @@
+from pathlib import Path
+import json
+import statistics
+import threading
+from typing import Optional
+import logging
+
+from .journal import atomic_write
+
+
+class TestbenchHistory:
+    """
+    Records the outcome and duration of every step across runs.
+
+    Steps are keyed by `task/type/tool/func`, only the last `keep` results of
+    each step are kept.
+    """
+
+    def __init__(self, path: Path, keep: int = 20):
+        self.log = logging.getLogger("history")
+
+        self.__path = path
+        self.__keep = keep
+        self.__lock = threading.Lock()
+        self.__steps: dict[str, list[dict]] = {}
+
+        if self.__path.exists():
+            try:
+                with open(self.__path, "r") as f:
+                    self.__steps = json.load(f).get("steps", {})
+            except (OSError, ValueError) as e:
+                self.log.warning(f"Ignoring unreadable history '{self.__path}': {e}")
+
+    def update(self, event: dict) -> None:
+        if event["type"] != "step" or event["state"] not in (
+            "done",
+            "failed",
+            "cancelled",
+        ):
+            return
+
+        with self.__lock:
+            results = self.__steps.setdefault(f"{event['task']}/{event['step']}", [])
+            results.append(
+                {
+                    "state": event["state"],
+                    "duration": event.get("duration"),
+                    "attempts": event.get("attempts", 1),
+                    "time": event["time"],
+                }
+            )
+            del results[: -self.__keep]
+
+    def save(self) -> None:
+        with self.__lock:
+            self.__path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.__path, json.dumps({"steps": self.__steps}, indent=2))
+        self.log.debug(f"Saved step history to '{self.__path}'")
+
+    def results(self, step: str) -> list[dict]:
+        return self.__steps.get(step, [])
+
+    def estimate(self, step: str) -> Optional[float]:
+        durations = [
+            r["duration"]
+            for r in self.results(step)
+            if r["state"] == "done" and r["duration"] is not None
+        ]
+        if not durations:
+            return None
+        return statistics.median(durations)
+
+    def flaky(
+        self, threshold: float, runs: int = 10, min_runs: int = 3
+    ) -> dict[str, float]:
+        """
+        Steps that failed or needed a retry in more than `threshold` of their
+        last `runs` completed runs, with their failure rate.
+        """
+        flaky = {}
+        for step in self.__steps:
+            results = [r for r in self.results(step) if r["state"] != "cancelled"]
+            results = results[-runs:]
+            if len(results) < min_runs:
+                continue
+
+            failures = sum(
+                1 for r in results if r["state"] == "failed" or r.get("attempts", 1) > 1
+            )
+            rate = failures / len(results)
+            if rate > threshold:
+                flaky[step] = rate
+        return flaky
@@ -0,0 +1,312 @@
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+def atomic_write(path: Path, content: str) -> None:
+    """
+    Write `content` to a temporary file next to `path` and rename it into place.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            os.chmod(tmp, path.stat().st_mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def read_lines(path: Path) -> list[str]:
+    with open(path, "r", newline="") as f:
+        return f.readlines()
+
+
+def revert_bytes(path: Path, changes: list[tuple[int, bytes, bytes]]) -> bool:
+    """
+    Write back the old bytes of `changes` (offset, old, new) applied to `path`.
+
+    Returns False without touching the file if a region holds neither its old
+    nor its new bytes.
+    """
+    with open(path, "r+b") as f:
+        regions = []
+        for offset, old, new in changes:
+            f.seek(offset)
+            current = f.read(len(new))
+            if current != new and current != old:
+                return False
+            if current == new:
+                regions.append((offset, old))
+
+        for offset, old in regions:
+            f.seek(offset)
+            f.write(old)
+        f.flush()
+        os.fsync(f.fileno())
+
+    return True
+
+
+def lock_file(f, blocking: bool = True) -> bool:
+    """
+    Exclusively lock the open file `f` until it is closed or the process exits.
+
+    Returns False if `blocking` is False and the lock is held by someone else.
+    """
+    try:
+        if os.name == "nt":
+            mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+            msvcrt.locking(f.fileno(), mode, 1)
+        else:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(f.fileno(), flags)
+    except OSError:
+        if blocking:
+            raise
+        return False
+    return True
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class FileJournal:
+    """
+    Records the changed lines of every file rewritten by a `File`, so the
+    originals can be restored without keeping full backups.
+
+    The journal is persisted on every change, files left modified by a crashed
+    run are restored by `recover`. Outstanding files are restored at exit.
+
+    Several testbenches, also in other processes, can share the journal. Each
+    entry records its owner, which holds a lock on its own lock file while it
+    is alive. Only entries of owners whose lock is free are recovered.
+    """
+
+    __active: ContextVar[Optional["FileJournal"]] = ContextVar(
+        "file_journal", default=None
+    )
+
+    def __init__(self, path: Path):
+        self.log = logging.getLogger("journal")
+
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, dict] = {}
+
+        self.__owner = f"{os.getpid()}-{time.time_ns()}"
+        self.__owner_file = None
+
+        atexit.register(self.__close)
+
+    @classmethod
+    def current(cls) -> Optional["FileJournal"]:
+        return cls.__active.get()
+
+    @contextmanager
+    def active(self) -> Iterator["FileJournal"]:
+        token = FileJournal.__active.set(self)
+        try:
+            yield self
+        finally:
+            FileJournal.__active.reset(token)
+
+    def __owner_path(self, owner: str) -> Path:
+        return self.__path.parent / f".{self.__path.name}.{owner}.lock"
+
+    def __is_alive(self, owner: Optional[str]) -> bool:
+        if owner is None or not self.__owner_path(owner).exists():
+            return False
+        with open(self.__owner_path(owner), "a") as f:
+            return not lock_file(f, blocking=False)
+
+    @contextmanager
+    def __shared(self) -> Iterator[dict[str, dict]]:
+        # The journal file is only read and replaced under a lock, so the
+        # testbenches sharing it do not drop each other's entries
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.__path.parent / f".{self.__path.name}.lock", "a") as lock:
+            lock_file(lock)
+            entries = {}
+            if self.__path.exists():
+                with open(self.__path, "r") as f:
+                    entries = json.load(f)
+            yield entries
+            atomic_write(self.__path, json.dumps(entries, indent=2))
+
+    def __save(self) -> None:
+        if self.__owner_file is None:
+            self.__path.parent.mkdir(parents=True, exist_ok=True)
+            self.__owner_file = open(self.__owner_path(self.__owner), "a")
+            lock_file(self.__owner_file)
+
+        with self.__shared() as entries:
+            for key, entry in list(entries.items()):
+                if entry.get("owner") == self.__owner:
+                    del entries[key]
+            entries.update(self.__entries)
+
+    def __close(self) -> None:
+        self.restore_all()
+        if self.__owner_file is not None:
+            self.__owner_file.close()
+            # Unrestored entries are recovered by the next testbench
+            self.__owner_path(self.__owner).unlink(missing_ok=True)
+
+    def write(self, path: Path, original: list[str], modified: list[str]) -> list:
+        """
+        Atomically replace `path` with `modified` and journal the changed lines.
+        """
+        # Changes are stored by character offset into the modified content, so
+        # replacements containing line breaks can still be reverted
+        changes = []
+        offset = 0
+        for i, (old, new) in enumerate(zip(original, modified)):
+            if old != new:
+                changes.append([i, offset, old, new])
+            offset += len(new)
+        if not changes:
+            return changes
+
+        key = str(path.absolute())
+        with self.__lock:
+            if key in self.__entries:
+                raise Exception(f"File '{path}' is already modified by this testbench")
+
+            self.__entries[key] = {
+                "owner": self.__owner,
+                "original": content_hash("".join(original)),
+                "modified": content_hash("".join(modified)),
+                "changes": changes,
+            }
+            self.__save()
+
+        atomic_write(path, "".join(modified))
+        self.log.debug(f"Rewrote {len(changes)} lines of '{path}'")
+
+        return changes
+
+    def write_bytes(self, path: Path, changes: list[tuple[int, bytes, bytes]]) -> None:
+        """
+        Journal byte `changes` (offset, old, new) of `path` before they are applied.
+        """
+        key = str(path.absolute())
+        with self.__lock:
+            if key in self.__entries:
+                raise Exception(f"File '{path}' is already modified by this testbench")
+
+            self.__entries[key] = {
+                "owner": self.__owner,
+                "kind": "bytes",
+                "changes": [
+                    [offset, old.hex(), new.hex()] for offset, old, new in changes
+                ],
+            }
+            self.__save()
+
+    def restore(self, path: Path) -> None:
+        key = str(path.absolute())
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return
+
+            self.__revert(Path(key), entry)
+            del self.__entries[key]
+            self.__save()
+
+    def restore_all(self) -> None:
+        with self.__lock:
+            if not self.__entries:
+                return
+
+            for key, entry in list(self.__entries.items()):
+                try:
+                    self.__revert(Path(key), entry)
+                except Exception as e:
+                    self.log.error(f"Could not restore '{key}': {e}")
+                    continue
+                del self.__entries[key]
+
+            self.__save()
+
+    def recover(self) -> None:
+        if not self.__path.exists():
+            return
+
+        with self.__lock, self.__shared() as entries:
+            owners = {entry.get("owner") for entry in entries.values()}
+            dead = {owner for owner in owners if not self.__is_alive(owner)}
+            stale = [
+                key for key, entry in entries.items() if entry.get("owner") in dead
+            ]
+            if not stale:
+                return
+
+            self.log.warning(
+                f"Restoring {len(stale)} files left modified by a previous run"
+            )
+            for key in stale:
+                try:
+                    self.__revert(Path(key), entries[key])
+                except Exception as e:
+                    self.log.error(f"Could not restore '{key}': {e}")
+                    continue
+                del entries[key]
+
+            for owner in dead - {None}:
+                if not any(entry.get("owner") == owner for entry in entries.values()):
+                    self.__owner_path(owner).unlink(missing_ok=True)
+
+    def __revert(self, path: Path, entry: dict) -> None:
+        if not path.exists():
+            self.log.warning(f"Cannot restore '{path}', file does not exist")
+            return
+
+        if entry.get("kind") == "bytes":
+            changes = [
+                (offset, bytes.fromhex(old), bytes.fromhex(new))
+                for offset, old, new in entry["changes"]
+            ]
+            if not revert_bytes(path, changes):
+                self.log.warning(
+                    f"Cannot restore '{path}', file was changed externally"
+                )
+                return
+            self.log.debug(f"Restored '{path}'")
+            return
+
+        content = "".join(read_lines(path))
+
+        current = content_hash(content)
+        if current == entry["original"]:
+            # Crashed before the modified file was renamed into place
+            return
+        if current != entry["modified"]:
+            self.log.warning(f"Cannot restore '{path}', file was changed externally")
+            return
+
+        for _, offset, old, new in reversed(entry["changes"]):
+            content = content[:offset] + old + content[offset + len(new) :]
+        atomic_write(path, content)
+        self.log.debug(f"Restored '{path}'")
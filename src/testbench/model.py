@@ -0,0 +1,157 @@
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Mapping, Optional
+import sys
+
+
+class _Frozen:
+    """
+    Base for the task model: attributes can only be set until `freeze()`.
+    """
+
+    __slots__ = ("_frozen",)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"{type(self).__name__} is immutable after load")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable after load")
+
+    def freeze(self) -> None:
+        object.__setattr__(self, "_frozen", True)
+
+
+class ToolConfig(_Frozen):
+    __slots__ = ("name", "params")
+
+    def __init__(self, name: str, params: dict):
+        self.name = sys.intern(name)
+        self.params = MappingProxyType(params)
+        self.freeze()
+
+
+class FileConfig(_Frozen):
+    __slots__ = ("path", "configs", "name")
+
+    def __init__(self, path: Path, configs: list, name: Optional[str]):
+        self.path = path
+        self.configs = configs
+        self.name = name
+        self.freeze()
+
+
+class Step(_Frozen):
+    """
+    A scheduled call of a tool function, `call` is bound once the tools of
+    the task are initialized.
+    """
+
+    __slots__ = (
+        "type",
+        "tool",
+        "func",
+        "name",
+        "inputs",
+        "outputs",
+        "retries",
+        "backoff",
+        "timeout",
+        "quarantined",
+        "call",
+    )
+
+    def __init__(
+        self,
+        type: str,
+        tool: str,
+        func: str,
+        inputs: tuple[str, ...] = (),
+        outputs: Optional[Mapping[str, Optional[str]]] = None,
+        retries: int = 0,
+        backoff: float = 0.0,
+        timeout: Optional[float] = None,
+        quarantined: bool = False,
+        call: Optional[Callable[[], Any]] = None,
+    ):
+        self.type = sys.intern(type)
+        self.tool = sys.intern(tool)
+        self.func = sys.intern(func)
+        self.name = sys.intern(f"{type}/{tool}/{func}")
+        self.inputs = tuple(sys.intern(name) for name in inputs)
+        self.outputs = MappingProxyType(
+            {sys.intern(name): path for name, path in (outputs or {}).items()}
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.quarantined = quarantined
+        self.call = call
+        self.freeze()
+
+    def replace(self, **changes: Any) -> "Step":
+        values = {
+            name: getattr(self, name) for name in self.__slots__ if name != "name"
+        }
+        values.update(changes)
+        return Step(**values)
+
+    def __repr__(self) -> str:
+        return f"Step({self.name})"
+
+
+class Task(_Frozen):
+    """
+    A task with its tools, files and scheduled steps.
+
+    The task is completed while the testbench loads, the schedule sets its
+    order and steps and `initialize_tasks` replaces the tool and file configs
+    by their instances. Afterwards it is frozen and shared between threads.
+    """
+
+    __slots__ = (
+        "name",
+        "path",
+        "output",
+        "tools",
+        "files",
+        "order",
+        "steps",
+        "cleanup",
+        "artifacts",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        path: Path,
+        output: Path,
+        tools: dict[str, dict[str, Any]],
+        files: dict[str, Any],
+    ):
+        self.name = sys.intern(name)
+        self.path = path
+        self.output = output
+        self.tools = tools
+        self.files = files
+        self.order: Optional[int] = None
+        self.steps: tuple[Step, ...] = ()
+        self.cleanup: tuple[Step, ...] = ()
+        self.artifacts = None
+
+    def freeze(self) -> None:
+        self.tools = MappingProxyType(
+            {t: MappingProxyType(tools) for t, tools in self.tools.items()}
+        )
+        self.files = MappingProxyType(self.files)
+        super().freeze()
+
+    def __getitem__(self, key: str) -> Any:
+        # Tools written against the former dict model index the task by key
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self) -> str:
+        return f"Task({self.name})"
@@ -0,0 +1,183 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import logging
+
+
+class TestbenchMonitor:
+    """
+    Collects schedule events and serves the live run state over HTTP.
+
+    `/status` returns the state as JSON, `/metrics` in Prometheus text format.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.log = logging.getLogger("monitor")
+
+        self.__lock = threading.Lock()
+        self.__tasks: dict[str, dict] = {}
+        self.__start_time = time.time()
+
+        self.__server = ThreadingHTTPServer((host, port), self.__handler())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(
+            target=self.__server.serve_forever, name="monitor", daemon=True
+        )
+
+    def __handler(self) -> type[BaseHTTPRequestHandler]:
+        monitor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                match self.path.split("?", 1)[0]:
+                    case "/" | "/status":
+                        body = json.dumps(monitor.get(), indent=2).encode()
+                        content_type = "application/json"
+                    case "/metrics":
+                        body = monitor.metrics().encode()
+                        content_type = "text/plain; version=0.0.4"
+                    case _:
+                        self.send_error(404)
+                        return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                monitor.log.debug(format % args)
+
+        return Handler
+
+    def start(self) -> None:
+        self.__thread.start()
+        self.log.info(f"Monitor listening on http://{self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self.__thread.is_alive():
+            self.__server.shutdown()
+        self.__server.server_close()
+
+    @property
+    def host(self) -> str:
+        return self.__server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.__server.server_address[1]
+
+    def update(self, event: dict) -> None:
+        with self.__lock:
+            match event["type"]:
+                case "task":
+                    task = self.__tasks.setdefault(
+                        event["task"],
+                        {
+                            "order": event.get("order"),
+                            "state": "pending",
+                            "start": None,
+                            "end": None,
+                            "steps": {},
+                        },
+                    )
+                    task["state"] = event["state"]
+                    if event["state"] == "running":
+                        task["start"] = event["time"]
+                    elif event["state"] in ("done", "failed", "cancelled"):
+                        task["end"] = event["time"]
+
+                case "step":
+                    task = self.__tasks.get(event["task"])
+                    if task is None:
+                        return
+                    step = task["steps"].setdefault(
+                        event["step"],
+                        {"stage": event["stage"], "state": "pending", "duration": None},
+                    )
+                    step["state"] = event["state"]
+                    # Retried attempts are running again, the duration covers
+                    # all attempts
+                    if event["state"] == "running" and "attempt" not in event:
+                        step["start"] = event["time"]
+                    if event.get("duration") is not None:
+                        step["duration"] = event["duration"]
+
+    def get(self) -> dict:
+        now = time.time()
+        with self.__lock:
+            tasks = {}
+            for task_name, task in self.__tasks.items():
+                steps = {}
+                for step_name, step in task["steps"].items():
+                    duration = step["duration"]
+                    if step["state"] in ("running", "retrying"):
+                        duration = now - step["start"]
+                    steps[step_name] = {
+                        "stage": step["stage"],
+                        "state": step["state"],
+                        "duration": duration,
+                    }
+
+                duration = None
+                if task["start"] is not None:
+                    duration = (task["end"] or now) - task["start"]
+
+                tasks[task_name] = {
+                    "order": task["order"],
+                    "state": task["state"],
+                    "duration": duration,
+                    "steps": steps,
+                }
+
+        return {
+            "uptime": now - self.__start_time,
+            "queue": sum(1 for t in tasks.values() if t["state"] == "pending"),
+            "running": [n for n, t in tasks.items() if t["state"] == "running"],
+            "tasks": tasks,
+        }
+
+    def metrics(self) -> str:
+        status = self.get()
+
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"')
+
+        lines = [
+            "# HELP testbench_uptime_seconds Time since the monitor was started",
+            "# TYPE testbench_uptime_seconds gauge",
+            f"testbench_uptime_seconds {status['uptime']:.3f}",
+            "# HELP testbench_queue_depth Number of tasks waiting to run",
+            "# TYPE testbench_queue_depth gauge",
+            f"testbench_queue_depth {status['queue']}",
+            "# HELP testbench_tasks Number of tasks per state",
+            "# TYPE testbench_tasks gauge",
+        ]
+        for state in ("pending", "running", "done", "failed", "cancelled"):
+            count = sum(1 for t in status["tasks"].values() if t["state"] == state)
+            lines.append(f'testbench_tasks{{state="{state}"}} {count}')
+
+        lines += [
+            "# HELP testbench_task_duration_seconds Duration of started tasks",
+            "# TYPE testbench_task_duration_seconds gauge",
+        ]
+        for task_name, task in status["tasks"].items():
+            if task["duration"] is not None:
+                lines.append(
+                    f'testbench_task_duration_seconds{{task="{label(task_name)}",state="{task["state"]}"}} {task["duration"]:.3f}'
+                )
+
+        lines += [
+            "# HELP testbench_step_duration_seconds Duration of started steps",
+            "# TYPE testbench_step_duration_seconds gauge",
+        ]
+        for task_name, task in status["tasks"].items():
+            for step_name, step in task["steps"].items():
+                if step["duration"] is not None:
+                    lines.append(
+                        f'testbench_step_duration_seconds{{task="{label(task_name)}",step="{label(step_name)}",stage="{step["stage"]}",state="{step["state"]}"}} {step["duration"]:.3f}'
+                    )
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,299 @@
+from pathlib import Path
+from typing import Any, Optional
+import logging
+
+from dotenv import dotenv_values
+import yaml
+import yaml_include
+
+from .common.config import load_config, replace_env
+from .tools import TestbenchTools
+from .files import TestbenchFiles
+from .tasks import TestbenchTasks
+from .schedule import TestbenchSchedule
+from .history import TestbenchHistory
+from .model import Step, Task
+
+
+class TestbenchPlanner:
+    """
+    Validates a testbench configuration and predicts how its schedule executes,
+    without creating output directories or touching any files.
+
+    Step durations are estimated from the history recorded by previous runs.
+    A step occupies the `resource` param of its tool, tasks of the same order
+    sharing a resource contend for it. Without the param every task has its
+    own tool instance, the step occupies `task/tool_type/tool_id`.
+    """
+
+    def __init__(
+        self,
+        config_path: Path | str,
+        history: Optional[Path | str] = None,
+        env_path: Optional[Path | str] = None,
+    ):
+        self.log = logging.getLogger("planner")
+
+        yaml.add_constructor("!inc", yaml_include.Constructor(), yaml.SafeLoader)
+
+        self.__config_path, self.__config = load_config(config_path)
+        self.log.info(f"Planning testbench: '{self.__config_path}'")
+
+        try:
+            self.__config = replace_env(self.__config, dotenv_values(env_path))
+        except Exception as e:
+            raise ValueError(f"Error setting up environment: {e}")
+
+        try:
+            tools_dir = Path(self.__get("registry", "tools")).resolve()
+            self.__tools = TestbenchTools(tools_dir).get()
+        except Exception as e:
+            raise ValueError(f"Error setting up tools: {e}")
+
+        try:
+            files_dir = Path(self.__get("registry", "files")).resolve()
+            self.__files = TestbenchFiles(files_dir).get()
+        except Exception as e:
+            raise ValueError(f"Error setting up files: {e}")
+
+        try:
+            # The output directory is only referenced, never created
+            self.__tasks = TestbenchTasks(
+                self.__get("tasks"), self.__tools, self.__files, Path("output")
+            ).get()
+        except Exception as e:
+            raise ValueError(f"Error setting up tasks: {e}")
+
+        try:
+            TestbenchSchedule(self.__get("schedule"), self.__tools, self.__tasks)
+        except Exception as e:
+            raise ValueError(f"Error setting up schedule: {e}")
+
+        history_path = Path(history) if history else Path("output") / "history.json"
+        if not history_path.exists():
+            self.log.warning(f"No history found at '{history_path}'")
+        self.__history = TestbenchHistory(history_path)
+
+        self.log.info("Configuration is valid")
+
+    def __get(self, *keys: str) -> Any:
+        value = self.__config
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                raise KeyError(f'Key "{key}" not found in configuration')
+            value = value[key]
+        return value
+
+    def __resource(self, task_name: str, task: Task, step: Step) -> str:
+        params = task.tools[step.type][step.tool].params
+        return params.get("resource", f"{task_name}/{step.type}/{step.tool}")
+
+    def plan(self) -> dict:
+        orders: dict[int, list[str]] = {}
+        for task_name, task in self.__tasks.items():
+            if task.order is not None:
+                orders.setdefault(task.order, []).append(task_name)
+
+        groups = []
+        resources: dict[str, dict] = {}
+        unknown = []
+        for order in sorted(orders):
+            tasks = {}
+            usage: dict[str, dict[str, float]] = {}
+            for task_name in orders[order]:
+                task = self.__tasks[task_name]
+
+                steps = []
+                for stage in ("steps", "cleanup"):
+                    for step in getattr(task, stage):
+                        step_name = step.name
+                        estimate = self.__history.estimate(f"{task_name}/{step_name}")
+                        if estimate is None:
+                            unknown.append(f"{task_name}/{step_name}")
+
+                        resource = self.__resource(task_name, task, step)
+                        busy = usage.setdefault(resource, {})
+                        busy[task_name] = busy.get(task_name, 0.0) + (estimate or 0.0)
+
+                        steps.append(
+                            {
+                                "step": step_name,
+                                "stage": stage,
+                                "resource": resource,
+                                "estimate": estimate,
+                                "inputs": list(step.inputs),
+                                "outputs": list(step.outputs),
+                            }
+                        )
+
+                tasks[task_name] = {
+                    "duration": sum(s["estimate"] or 0.0 for s in steps),
+                    "waiting": 0.0,
+                    "steps": steps,
+                }
+
+            self.__schedule_artifacts(tasks)
+            duration = max(t["duration"] for t in tasks.values())
+            critical = max(tasks, key=lambda t: tasks[t]["duration"])
+
+            # Tasks contending for a resource cannot be faster than its total use
+            contention = {
+                resource: sorted(busy)
+                for resource, busy in usage.items()
+                if len(busy) > 1
+            }
+            serialized = max(
+                [duration] + [sum(busy.values()) for busy in usage.values()]
+            )
+
+            for resource, busy in usage.items():
+                total = resources.setdefault(
+                    resource, {"busy": 0.0, "tasks": set(), "contended": []}
+                )
+                total["busy"] += sum(busy.values())
+                total["tasks"].update(busy)
+                if resource in contention:
+                    total["contended"].append(order)
+
+            groups.append(
+                {
+                    "order": order,
+                    "tasks": tasks,
+                    "duration": duration,
+                    "serialized": serialized,
+                    "critical": critical,
+                    "contention": contention,
+                }
+            )
+
+        makespan = sum(g["duration"] for g in groups)
+        makespan_serialized = sum(g["serialized"] for g in groups)
+        bottlenecks = sorted(
+            (
+                {
+                    "resource": resource,
+                    "busy": total["busy"],
+                    "utilization": (
+                        total["busy"] / makespan_serialized
+                        if makespan_serialized
+                        else 0.0
+                    ),
+                    "tasks": sorted(total["tasks"]),
+                    "contended": total["contended"],
+                }
+                for resource, total in resources.items()
+            ),
+            key=lambda r: r["busy"],
+            reverse=True,
+        )
+
+        return {
+            "makespan": makespan,
+            "makespan_serialized": makespan_serialized,
+            "groups": groups,
+            "critical_path": [
+                {
+                    "order": g["order"],
+                    "task": g["critical"],
+                    "duration": g["duration"],
+                }
+                for g in groups
+            ],
+            "bottlenecks": bottlenecks,
+            "unknown": unknown,
+        }
+
+    @staticmethod
+    def __schedule_artifacts(tasks: dict) -> None:
+        # A step starts once the previous step of its task and the producers of
+        # its inputs in the same group have finished, earlier groups are done
+        producers = {}
+        for task_name, task in tasks.items():
+            for i, step in enumerate(task["steps"]):
+                for name in step["outputs"]:
+                    producers[name] = (task_name, i)
+
+        finish: dict[tuple[str, int], float] = {}
+
+        def finished(task_name: str, i: int) -> float:
+            if (task_name, i) not in finish:
+                step = tasks[task_name]["steps"][i]
+                start = finished(task_name, i - 1) if i else 0.0
+                for name in step["inputs"]:
+                    if name in producers:
+                        start = max(start, finished(*producers[name]))
+                finish[(task_name, i)] = start + (step["estimate"] or 0.0)
+            return finish[(task_name, i)]
+
+        for task_name, task in tasks.items():
+            if task["steps"]:
+                end = finished(task_name, len(task["steps"]) - 1)
+                task["waiting"] = end - task["duration"]
+                task["duration"] = end
+
+    def report(self, plan: Optional[dict] = None) -> str:
+        plan = plan or self.plan()
+
+        def duration(value: Optional[float]) -> str:
+            return f"{'?':>9}" if value is None else f"{value:8.2f}s"
+
+        lines = [
+            f"Plan for '{self.__config_path}'",
+            "-" * 45,
+            f"Estimated wall time: {plan['makespan']:.2f}s",
+        ]
+        if plan["makespan_serialized"] > plan["makespan"]:
+            lines.append(
+                f"Estimated wall time with contended resources: "
+                f"{plan['makespan_serialized']:.2f}s"
+            )
+        if plan["unknown"]:
+            lines.append(
+                f"{len(plan['unknown'])} steps without recorded duration count as 0s"
+            )
+
+        for group in plan["groups"]:
+            lines.append("")
+            lines.append(
+                f"Order {group['order']} ({len(group['tasks'])} tasks in parallel):"
+                f" {group['duration']:.2f}s"
+            )
+            for task_name, task in group["tasks"].items():
+                marker = "*" if task_name == group["critical"] else " "
+                waiting = (
+                    f" ({task['waiting']:.2f}s waiting for artifacts)"
+                    if task["waiting"] > 0
+                    else ""
+                )
+                lines.append(
+                    f"  {marker} {duration(task['duration'])}  {task_name}{waiting}"
+                )
+                for step in task["steps"]:
+                    lines.append(
+                        f"      {duration(step['estimate'])}  {step['step']}"
+                        f" ({step['stage']}, {step['resource']})"
+                    )
+            for resource, tasks in group["contention"].items():
+                lines.append(f"  ! {resource} contended by {', '.join(tasks)}")
+
+        lines.append("")
+        lines.append("Critical path:")
+        for entry in plan["critical_path"]:
+            lines.append(
+                f"  {entry['duration']:8.2f}s  order {entry['order']}: {entry['task']}"
+            )
+
+        lines.append("")
+        lines.append("Resources:")
+        for resource in plan["bottlenecks"]:
+            contended = (
+                f", contended at order {', '.join(map(str, resource['contended']))}"
+                if resource["contended"]
+                else ""
+            )
+            lines.append(
+                f"  {resource['utilization']:6.1%}  {resource['busy']:8.2f}s  "
+                f"{resource['resource']}{contended}"
+            )
+
+        return "\n".join(lines) + "\n"
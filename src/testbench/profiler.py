@@ -0,0 +1,176 @@
+from pathlib import Path
+from fnmatch import fnmatch
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+import logging
+
+
+class TestbenchProfiler:
+    """
+    Wraps step functions and file construction with cProfile and/or tracemalloc.
+
+    Steps are named `type/tool/func`, file constructions `file/<file_type>`. The
+    `tasks` and `steps` filters are glob patterns, a step also matches by its
+    bare function name.
+    """
+
+    # cProfile and tracemalloc are process-wide, so these are shared by all
+    # profilers of the process, e.g. the runs of a batch. Only one step can be
+    # profiled at a time, concurrent steps run unprofiled.
+    __lock = threading.Lock()
+    __tracing_lock = threading.Lock()
+    __tracing = 0
+    __started_tracing = False
+
+    def __init__(
+        self,
+        cprofile: bool = True,
+        memory: bool = False,
+        tasks: Optional[list[str]] = None,
+        steps: Optional[list[str]] = None,
+        top: int = 20,
+    ):
+        self.log = logging.getLogger("profiler")
+
+        self.__cprofile = cprofile
+        self.__memory = memory
+        self.__tasks = tasks
+        self.__steps = steps
+        self.__top = top
+
+        self.__results: list[dict] = []
+        self.__closed = False
+
+        if self.__memory:
+            with TestbenchProfiler.__tracing_lock:
+                if TestbenchProfiler.__tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    TestbenchProfiler.__started_tracing = True
+                TestbenchProfiler.__tracing += 1
+
+    def matches(self, task_name: str, step_name: str) -> bool:
+        if self.__tasks and not any(fnmatch(task_name, p) for p in self.__tasks):
+            return False
+        if self.__steps:
+            func_name = step_name.rsplit("/", 1)[-1]
+            return any(
+                fnmatch(step_name, p) or fnmatch(func_name, p) for p in self.__steps
+            )
+        return True
+
+    def run(self, func: Callable[[], Any], name: str, output: Path) -> Any:
+        if not self.__lock.acquire(blocking=False):
+            self.log.warning(f"Profiler busy, running '{name}' unprofiled")
+            return func()
+
+        try:
+            # Profiling must never change the outcome of a step, failures of the
+            # profiler itself only log a warning
+            try:
+                output.parent.mkdir(parents=True, exist_ok=True)
+                before = tracemalloc.take_snapshot() if self.__memory else None
+                profile = cProfile.Profile() if self.__cprofile else None
+                if profile is not None:
+                    profile.enable()
+            except Exception as e:
+                self.log.warning(f"Could not profile '{name}', running unprofiled: {e}")
+                return func()
+
+            start_time = time.time()
+            try:
+                return func()
+            finally:
+                duration = time.time() - start_time
+                if profile is not None:
+                    profile.disable()
+
+                try:
+                    self.__record(name, output, duration, profile, before)
+                except Exception as e:
+                    self.log.warning(f"Could not write profile of '{name}': {e}")
+        finally:
+            self.__lock.release()
+
+    def __record(
+        self,
+        name: str,
+        output: Path,
+        duration: float,
+        profile: Optional[cProfile.Profile],
+        before: Optional[tracemalloc.Snapshot],
+    ) -> None:
+        result = {"name": name, "duration": duration, "prof": None, "memory": None}
+
+        if profile is not None:
+            prof_path = output.with_name(f"{output.name}.prof")
+            profile.dump_stats(prof_path)
+            result["prof"] = prof_path
+            self.log.debug(f"Wrote profile of '{name}' to '{prof_path}'")
+
+        if before is not None:
+            after = tracemalloc.take_snapshot()
+            memory_path = output.with_name(f"{output.name}_tracemalloc.txt")
+            self.__write_memory(name, before, after, memory_path)
+            result["memory"] = memory_path
+
+        self.__results.append(result)
+
+    def __write_memory(
+        self,
+        name: str,
+        before: tracemalloc.Snapshot,
+        after: tracemalloc.Snapshot,
+        path: Path,
+    ) -> None:
+        stats = after.compare_to(before, "lineno")
+        total = sum(stat.size_diff for stat in stats)
+
+        with open(path, "w") as f:
+            f.write(f"tracemalloc\nstep: {name}\n")
+            f.write(f"Total allocated: {total / 1024:.1f} KiB\n")
+            f.write("-" * 45 + "\n\n")
+            for stat in stats[: self.__top]:
+                f.write(f"{stat}\n")
+
+        self.log.debug(f"Wrote allocations of '{name}' to '{path}'")
+
+    def write_summary(self, path: Path) -> None:
+        if not self.__results:
+            return
+
+        with open(path, "w") as f:
+            f.write("Profile summary\n")
+            f.write(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write("-" * 45 + "\n\n")
+
+            f.write("Hottest steps:\n")
+            ranked = sorted(self.__results, key=lambda r: r["duration"], reverse=True)
+            for result in ranked[: self.__top]:
+                f.write(f"  {result['duration']:10.3f}s  {result['name']}\n")
+
+            prof_paths = [str(r["prof"]) for r in self.__results if r["prof"]]
+            if prof_paths:
+                stream = io.StringIO()
+                stats = pstats.Stats(*prof_paths, stream=stream)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.__top)
+                f.write("\nHottest functions:\n")
+                f.write(stream.getvalue())
+
+        self.log.info(f"Wrote profile summary to '{path}'")
+
+    def close(self) -> None:
+        if not self.__memory or self.__closed:
+            return
+        self.__closed = True
+
+        # Tracing stops with the last profiler, unless it was started elsewhere
+        with TestbenchProfiler.__tracing_lock:
+            TestbenchProfiler.__tracing -= 1
+            if TestbenchProfiler.__tracing == 0 and TestbenchProfiler.__started_tracing:
+                tracemalloc.stop()
+                TestbenchProfiler.__started_tracing = False
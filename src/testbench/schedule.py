@@ -1,27 +1,84 @@
+from concurrent.futures import Executor
+import asyncio
+import functools
+import inspect
 import time
 import threading
-from typing import Optional
+from typing import Callable, Optional
 import logging
 
+from .profiler import TestbenchProfiler
+from .artifacts import TestbenchArtifacts
+from .model import Step, Task
+
 
 class TestbenchSchedule:
-    def __init__(self, config: dict, tools: dict, tasks: dict):
+    def __init__(
+        self,
+        config: dict,
+        tools: dict,
+        tasks: dict[str, Task],
+        listeners: Optional[list[Callable[[dict], None]]] = None,
+        profiler: Optional[TestbenchProfiler] = None,
+        executor: Optional[Executor] = None,
+        artifacts: Optional[TestbenchArtifacts] = None,
+        quarantine: Optional[set[str]] = None,
+        quarantine_action: str = "quarantine",
+    ):
         self.log = logging.getLogger("schedule")
 
         self.__config = config
         self.__tools = tools
         self.__tasks = tasks
+        self.__listeners = listeners or []
+        self.__profiler = profiler
+        self.__executor = executor
+        self.__artifacts = artifacts or TestbenchArtifacts()
+        self.__quarantine = quarantine or set()
+        self.__quarantine_action = quarantine_action
+        self.__lock = threading.Lock()
+        self.__attempts: dict[str, list[dict]] = {}
+        self.__failed: list[str] = []
 
         try:
             self.__parse_schedule()
         except Exception as e:
             raise ValueError(f"Error setting up schedule: {e}")
 
+        # The orders are final once parsed, group the tasks only once
+        self.__orders: dict[int, dict[str, Task]] = {}
+        for task_name, task in self.__tasks.items():
+            if task.order is not None:
+                self.__orders.setdefault(task.order, {})[task_name] = task
+
         self.__current = self.__get_lowest(0)
 
         if self.__current is None:
             self.log.warning("Schedule is empty, no tasks to run")
 
+        for task_name, task in self.__tasks.items():
+            if task.order is not None:
+                self.__emit(
+                    type="task", task=task_name, order=task.order, state="pending"
+                )
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[dict], None]) -> None:
+        self.__listeners.remove(listener)
+
+    def __emit(self, **event) -> None:
+        if not self.__listeners:
+            return
+
+        event["time"] = time.time()
+        for listener in list(self.__listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                self.log.warning(f"Schedule listener failed: {e}")
+
     def __parse_schedule(self) -> None:
         self.log.debug("Parsing schedule configuration")
 
@@ -45,75 +102,208 @@ class TestbenchSchedule:
                 raise KeyError(f'No steps found in schedule for task "{task_name}"')
             task_steps = schedule_task["steps"]
 
-            cleanup_steps = schedule_task.get("cleanup", [])
+            cleanup_steps = schedule_task.get("cleanup", None) or {}
 
             task_steps_list = []
             for step_name in task_steps:
-                step = schedule_task["steps"][step_name]
-                step_tool_type, step_tool = step.split(";")
-
-                if step_tool_type not in task["tools"]:
-                    raise KeyError(
-                        f'Tool type "{step_tool_type}" not found in tools of task "{task_name}"'
-                    )
-                if step_tool not in task["tools"][step_tool_type]:
-                    raise KeyError(
-                        f'No tool "{step_tool}" of type "{step_tool_type}" found in task "{task_name}"'
-                    )
-                if (
-                    step_name
-                    not in self.__tools[step_tool_type][step_tool]["cls"].__dict__
-                ):
-                    raise KeyError(
-                        f'Tool "{step_tool}" of type "{step_tool_type}" does not have function "{step_name}"'
-                    )
-
                 task_steps_list.append(
-                    {"type": step_tool_type, "tool": step_tool, "func": step_name}
+                    self.__parse_step(task_name, task, step_name, task_steps[step_name])
                 )
 
             task_cleanup_list = []
             for step_name in cleanup_steps:
-                step = schedule_task["cleanup"][step_name]
-                step_tool_type, step_tool = step.split(";")
-
-                if step_tool_type not in task["tools"]:
-                    raise KeyError(
-                        f'Tool type "{step_tool_type}" not found in tools of task "{task_name}"'
-                    )
-                if step_tool not in task["tools"][step_tool_type]:
-                    raise KeyError(
-                        f'No tool "{step_tool}" of type "{step_tool_type}" found in task "{task_name}"'
-                    )
-                if (
-                    step_name
-                    not in self.__tools[step_tool_type][step_tool]["cls"].__dict__
-                ):
-                    raise KeyError(
-                        f'Tool "{step_tool}" of type "{step_tool_type}" does not have function "{step_name}"'
-                    )
-
                 task_cleanup_list.append(
-                    {"type": step_tool_type, "tool": step_tool, "func": step_name}
+                    self.__parse_step(
+                        task_name, task, step_name, cleanup_steps[step_name]
+                    )
                 )
 
-            self.__tasks[task_name]["order"] = task_order
-            self.__tasks[task_name]["steps"] = task_steps_list
-            self.__tasks[task_name]["cleanup"] = task_cleanup_list
+            task.order = task_order
+            task.steps = tuple(task_steps_list)
+            task.cleanup = tuple(task_cleanup_list)
+
+        for task_name, task in self.__tasks.items():
+            task.artifacts = self.__artifacts
 
-        for task_name in self.__tasks:
-            if "order" not in self.__tasks[task_name]:
+            if task.order is None:
                 self.log.warning(f'Task "{task_name}" included but not in schedule')
                 continue
 
+        self.__apply_quarantine()
+        self.__check_artifacts()
+
+    def __parse_step(self, task_name: str, task: Task, step_name: str, step) -> Step:
+        # A step is either "tool_type;tool_id" or a mapping with the tool, the
+        # artifacts it consumes (inputs) and publishes (outputs) and its retries
+        inputs, outputs = [], {}
+        retries, backoff, timeout = 0, 0.0, None
+        if isinstance(step, dict):
+            if "tool" not in step:
+                raise KeyError(f'No tool found for step "{step_name}" of "{task_name}"')
+            inputs = tuple(step.get("inputs", None) or ())
+            outputs = step.get("outputs", None) or {}
+            if not isinstance(outputs, dict):
+                outputs = {name: None for name in outputs}
+
+            retries = step.get("retries", 0)
+            if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+                raise ValueError(
+                    f'Retries of step "{step_name}" of "{task_name}" must be a non-negative integer'
+                )
+            backoff = step.get("backoff", 0.0)
+            if (
+                isinstance(backoff, bool)
+                or not isinstance(backoff, (int, float))
+                or backoff < 0
+            ):
+                raise ValueError(
+                    f'Backoff of step "{step_name}" of "{task_name}" must be a non-negative number'
+                )
+            timeout = step.get("timeout", None)
+            if timeout is not None and (
+                isinstance(timeout, bool)
+                or not isinstance(timeout, (int, float))
+                or timeout <= 0
+            ):
+                raise ValueError(
+                    f'Timeout of step "{step_name}" of "{task_name}" must be a positive number'
+                )
+            step = step["tool"]
+
+        step_tool_type, step_tool = step.split(";")
+
+        if step_tool_type not in task.tools:
+            raise KeyError(
+                f'Tool type "{step_tool_type}" not found in tools of task "{task_name}"'
+            )
+        if step_tool not in task.tools[step_tool_type]:
+            raise KeyError(
+                f'No tool "{step_tool}" of type "{step_tool_type}" found in task "{task_name}"'
+            )
+        if step_name not in self.__tools[step_tool_type][step_tool]["cls"].__dict__:
+            raise KeyError(
+                f'Tool "{step_tool}" of type "{step_tool_type}" does not have function "{step_name}"'
+            )
+
+        return Step(
+            step_tool_type,
+            step_tool,
+            step_name,
+            inputs,
+            outputs,
+            retries,
+            backoff,
+            timeout,
+        )
+
+    def __apply_quarantine(self) -> None:
+        if not self.__quarantine:
+            return
+
+        scheduled = {n: t for n, t in self.__tasks.items() if t.order is not None}
+        quarantined = self.__quarantine_action == "quarantine"
+
+        flagged = set()
+        for task_name, task in scheduled.items():
+            for stage in ("steps", "cleanup"):
+                steps = []
+                for step in getattr(task, stage):
+                    key = f"{task_name}/{step.name}"
+                    if key in self.__quarantine:
+                        self.log.debug(f"Quarantined step: {key}")
+                        step = step.replace(quarantined=quarantined)
+                        flagged.add(task_name)
+                    steps.append(step)
+                setattr(task, stage, tuple(steps))
+
+        if self.__quarantine_action != "defer" or not flagged:
+            return
+
+        # Consumers of artifacts published by deferred tasks are deferred too
+        producers = {
+            name: task_name
+            for task_name, task in scheduled.items()
+            for step in task.steps + task.cleanup
+            for name in step.outputs
+        }
+        changed = True
+        while changed:
+            changed = False
+            for task_name, task in scheduled.items():
+                if task_name in flagged:
+                    continue
+                if any(
+                    producers.get(name) in flagged
+                    for step in task.steps + task.cleanup
+                    for name in step.inputs
+                ):
+                    flagged.add(task_name)
+                    changed = True
+
+        # Deferred tasks keep their relative order after all other tasks
+        highest = max(task.order for task in scheduled.values())
+        lowest = min(task.order for task in scheduled.values())
+        for task_name in sorted(flagged):
+            scheduled[task_name].order += highest - lowest + 1
+            self.log.warning(
+                f'Deferred task "{task_name}" to order {scheduled[task_name].order}'
+            )
+
+    def __check_artifacts(self) -> None:
+        # Every step waits for the previous step of its task and the producers of
+        # its inputs, these dependencies must not form a cycle
+        producers: dict[str, tuple[str, int]] = {}
+        dependencies: dict[tuple[str, int], list[tuple[str, int]]] = {}
+        for task_name, task in self.__tasks.items():
+            if task.order is None:
+                continue
+            for i, step in enumerate(task.steps + task.cleanup):
+                dependencies[(task_name, i)] = [(task_name, i - 1)] if i else []
+                for name in step.outputs:
+                    if name in producers:
+                        raise KeyError(
+                            f'Artifact "{name}" is published by "{producers[name][0]}" and "{task_name}"'
+                        )
+                    producers[name] = (task_name, i)
+
+        for task_name, task in self.__tasks.items():
+            if task.order is None:
+                continue
+            for i, step in enumerate(task.steps + task.cleanup):
+                for name in step.inputs:
+                    if name not in producers:
+                        raise KeyError(
+                            f'Artifact "{name}" of task "{task_name}" is not published by any step'
+                        )
+                    producer = producers[name][0]
+                    if self.__tasks[producer].order > task.order:
+                        raise ValueError(
+                            f'Artifact "{name}" of task "{task_name}" is published by "{producer}" with a later order'
+                        )
+                    if self.__tasks[producer].order == task.order:
+                        dependencies[(task_name, i)].append(producers[name])
+
+        visited: dict[tuple[str, int], bool] = {}
+
+        def visit(node: tuple[str, int]) -> None:
+            if node in visited:
+                if not visited[node]:
+                    raise ValueError(
+                        f'Artifacts of task "{node[0]}" depend on each other in a cycle'
+                    )
+                return
+            visited[node] = False
+            for dependency in dependencies[node]:
+                visit(dependency)
+            visited[node] = True
+
+        for node in dependencies:
+            visit(node)
+
     def __get_lowest(self, min: int) -> Optional[int]:
         # Get lowest order task above min
         lowest = None
-        for task_name in self.__tasks:
-            if "order" not in self.__tasks[task_name]:
-                continue
-
-            task_order = self.__tasks[task_name]["order"]
+        for task_order in self.__orders:
             if task_order < min:
                 continue
             if not lowest or task_order < lowest:
@@ -121,24 +311,19 @@ class TestbenchSchedule:
 
         return lowest
 
-    def __get_tasks(self, order: int) -> dict:
-        tasks = {}
-        for task_name in self.__tasks:
-            if "order" not in self.__tasks[task_name]:
-                continue
-
-            task_order = self.__tasks[task_name]["order"]
-            if task_order == order:
-                tasks[task_name] = self.__tasks[task_name]
-
-        return tasks
+    def __get_tasks(self, order: int) -> dict[str, Task]:
+        return self.__orders.get(order, {})
 
     def is_done(self) -> bool:
         return self.__current is None
 
-    def iterate(self) -> Optional[int]:
-        self.log.debug("Iterating schedule")
+    def get_attempts(self) -> dict[str, list[dict]]:
+        return self.__attempts
+
+    def get_failed(self) -> list[str]:
+        return self.__failed
 
+    def __next_order(self) -> Optional[tuple[int, dict]]:
         if self.__current is None:
             self.log.warning("No current task to run, schedule is done.")
             return None
@@ -157,6 +342,16 @@ class TestbenchSchedule:
 
         self.log.debug(f"Running order {len(current_tasks)} tasks at order {current}")
 
+        return current, current_tasks
+
+    def iterate(self) -> Optional[int]:
+        self.log.debug("Iterating schedule")
+
+        next_order = self.__next_order()
+        if next_order is None:
+            return None
+        current, current_tasks = next_order
+
         if len(current_tasks) > 1:
             threads = []
             for task_name in current_tasks:
@@ -176,38 +371,400 @@ class TestbenchSchedule:
 
         return current
 
-    def __run_task(self, task_name: str, task: dict) -> None:
-        self.log.info(f"Running task: {task_name}")
+    async def iterate_async(self) -> Optional[int]:
+        self.log.debug("Iterating schedule")
 
-        for step in task["steps"]:
-            self.log.info(
-                f"Running step: {task_name}/{step['type']}/{step['tool']}/{step['func']}"
-            )
-            start_time = time.time()
-            try:
-                getattr(task["tools"][step["type"]][step["tool"]], step["func"])()
-                end_time = time.time()
-                self.log.info(
-                    f"Done ({end_time - start_time:.2f}s): {task_name}/{step['type']}/{step['tool']}/{step['func']}"
+        next_order = self.__next_order()
+        if next_order is None:
+            return None
+        current, current_tasks = next_order
+
+        # Wait for every task, including its cleanup, before propagating a
+        # cancellation
+        results = await asyncio.gather(
+            *(
+                self.__run_task_async(task_name, task)
+                for task_name, task in current_tasks.items()
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return current
+
+    def __call_step(self, task_name: str, step: Step):
+        if step.call is None:
+            raise Exception(f"Step {step.name} of {task_name} is not initialized")
+
+        if self.__profiler is None or not self.__profiler.matches(task_name, step.name):
+            return step.call()
+
+        return self.__profiler.run(
+            step.call,
+            f"{task_name}/{step.name}",
+            step.call.__self__.output_dir / step.func,
+        )
+
+    async def __call_step_async(self, task_name: str, step: Step):
+        # Coroutine steps run on the event loop, blocking steps in the executor
+        # (default: the one of the loop) so they do not stall other runs
+        if inspect.iscoroutinefunction(step.call):
+            if self.__profiler is not None and self.__profiler.matches(
+                task_name, step.name
+            ):
+                self.log.warning(
+                    f"Coroutine steps are not profiled: {task_name}/{step.name}"
                 )
-            except Exception as e:
-                end_time = time.time()
-                self.log.error(
-                    f"Failed ({end_time - start_time:.2f}s): {task_name}/{step['type']}/{step['tool']}/{step['func']} ({e})"
+            if step.timeout is None:
+                return await step.call()
+            try:
+                return await asyncio.wait_for(step.call(), step.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timed out after {step.timeout}s")
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self.__executor, functools.partial(self.__call_step_timed, task_name, step)
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # A blocking step cannot be interrupted, kill its commands and wait
+            # until it returned, the cleanup must not overlap it
+            self.log.warning(f"Waiting for cancelled step: {task_name}/{step.name}")
+            step.call.__self__.kill_commands()
+            await asyncio.wait([future])
+            # Retrieve the error of the killed step, it is replaced by the
+            # cancellation
+            future.exception()
+            raise
+
+    def __step_started(self, task_name: str, step_name: str, stage: str) -> float:
+        if stage == "steps":
+            self.log.info(f"Running step: {task_name}/{step_name}")
+        self.__emit(
+            type="step", task=task_name, step=step_name, stage=stage, state="running"
+        )
+        return time.time()
+
+    def __step_finished(
+        self,
+        task_name: str,
+        step_name: str,
+        stage: str,
+        start_time: float,
+        error: Optional[BaseException] = None,
+        attempts: int = 1,
+    ) -> None:
+        duration = time.time() - start_time
+
+        if isinstance(error, asyncio.CancelledError):
+            state = "cancelled"
+            self.log.warning(f"Cancelled ({duration:.2f}s): {task_name}/{step_name}")
+        elif error is not None:
+            state = "failed"
+            prefix = "Failed" if stage == "steps" else "Clean failed"
+            self.log.error(
+                f"{prefix} ({duration:.2f}s): {task_name}/{step_name} ({error})"
+            )
+        else:
+            state = "done"
+            prefix = "Done" if stage == "steps" else "Cleaned"
+            self.log.info(f"{prefix} ({duration:.2f}s): {task_name}/{step_name}")
+
+        self.__emit(
+            type="step",
+            task=task_name,
+            step=step_name,
+            stage=stage,
+            state=state,
+            duration=duration,
+            attempts=attempts,
+        )
+
+    def __attempt_finished(
+        self,
+        task_name: str,
+        step_name: str,
+        stage: str,
+        step: Step,
+        attempt: int,
+        start_time: float,
+        error: Optional[BaseException] = None,
+    ) -> Optional[float]:
+        with self.__lock:
+            self.__attempts.setdefault(f"{task_name}/{step_name}", []).append(
+                {
+                    "attempt": attempt,
+                    "state": "done" if error is None else "failed",
+                    "duration": time.time() - start_time,
+                    "error": None if error is None else str(error),
+                    "time": start_time,
+                }
+            )
+
+        if error is None or attempt > step.retries:
+            return None
+
+        delay = step.backoff * 2 ** (attempt - 1)
+        self.log.warning(
+            f"Retrying in {delay:.2f}s ({attempt}/{step.retries}): "
+            f"{task_name}/{step_name} ({error})"
+        )
+        self.__emit(
+            type="step",
+            task=task_name,
+            step=step_name,
+            stage=stage,
+            state="retrying",
+            attempt=attempt,
+            delay=delay,
+        )
+        return delay
+
+    def __attempt_started(
+        self, task_name: str, step_name: str, stage: str, attempt: int
+    ) -> None:
+        self.__emit(
+            type="step",
+            task=task_name,
+            step=step_name,
+            stage=stage,
+            state="running",
+            attempt=attempt,
+        )
+
+    def __call_step_timed(self, task_name: str, step: Step):
+        if step.timeout is None:
+            return self.__call_step(task_name, step)
+
+        # A blocking step cannot be interrupted, on timeout the commands of its
+        # tool are killed and the step fails once it returned. It is never
+        # left running, so retries and cleanup do not overlap it.
+        expired = threading.Event()
+
+        def expire() -> None:
+            expired.set()
+            self.log.warning(
+                f"Timed out after {step.timeout}s, killing commands: "
+                f"{task_name}/{step.name}"
+            )
+            step.call.__self__.kill_commands()
+
+        timer = threading.Timer(step.timeout, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            result = self.__call_step(task_name, step)
+        except Exception as e:
+            if expired.is_set():
+                raise TimeoutError(f"Timed out after {step.timeout}s") from e
+            raise
+        finally:
+            timer.cancel()
+
+        if expired.is_set():
+            raise TimeoutError(f"Timed out after {step.timeout}s")
+        return result
+
+    def __publish(self, task_name: str, task: Task, step: Step, result) -> None:
+        for name, path in step.outputs.items():
+            if isinstance(result, dict) and name in result:
+                path = result[name]
+            if path is None:
+                raise Exception(f'Step did not return a path for artifact "{name}"')
+            self.__artifacts.publish(name, task.path / path)
+            self.__emit(
+                type="artifact",
+                task=task_name,
+                name=name,
+                state="published",
+                path=str(self.__artifacts.get(name)),
+            )
+
+    def __unpublished(self, task_name: str, steps: tuple[Step, ...]) -> None:
+        # Fail the outputs of failed and skipped steps right away, later steps
+        # of the same task may be waiting for them
+        for step in steps:
+            for name in step.outputs:
+                if not self.__artifacts.is_ready(name):
+                    self.__artifacts.fail(
+                        name, f'Task "{task_name}" did not publish it'
+                    )
+                    self.__emit(
+                        type="artifact", task=task_name, name=name, state="failed"
+                    )
+
+    def __execute_step(self, task_name: str, stage: str, task: Task, step: Step):
+        step_name = step.name
+        start_time = time.time()
+        attempt = 1
+        try:
+            for name in step.inputs:
+                if not self.__artifacts.is_ready(name):
+                    self.log.info(f'Waiting for "{name}": {task_name}/{step_name}')
+                    self.__emit(
+                        type="step",
+                        task=task_name,
+                        step=step_name,
+                        stage=stage,
+                        state="waiting",
+                    )
+                self.__artifacts.wait(name)
+
+            start_time = self.__step_started(task_name, step_name, stage)
+            while True:
+                attempt_start = time.time()
+                try:
+                    result = self.__call_step_timed(task_name, step)
+                except Exception as e:
+                    delay = self.__attempt_finished(
+                        task_name, step_name, stage, step, attempt, attempt_start, e
+                    )
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    self.__attempt_started(task_name, step_name, stage, attempt)
+                    continue
+
+                self.__attempt_finished(
+                    task_name, step_name, stage, step, attempt, attempt_start
                 )
                 break
 
-        for step in task["cleanup"]:
-            start_time = time.time()
-            try:
-                start_time = time.time()
-                getattr(task["tools"][step["type"]][step["tool"]], step["func"])()
-                end_time = time.time()
-                self.log.info(
-                    f"Cleaned ({end_time - start_time:.2f}s): {task_name}/{step['type']}/{step['tool']}/{step['func']}"
+            self.__publish(task_name, task, step, result)
+        except Exception as e:
+            self.__step_finished(task_name, step_name, stage, start_time, e, attempt)
+            self.__unpublished(task_name, (step,))
+            if step.quarantined:
+                self.log.warning(
+                    f"Ignoring failure of quarantined step: {task_name}/{step_name}"
                 )
-            except Exception as e:
-                end_time = time.time()
-                self.log.error(
-                    f"Clean failed ({end_time - start_time:.2f}s): {task_name}/{step['type']}/{step['tool']}/{step['func']} ({e})"
+                return
+            raise
+        self.__step_finished(task_name, step_name, stage, start_time, None, attempt)
+
+    async def __execute_step_async(
+        self, task_name: str, stage: str, task: Task, step: Step
+    ):
+        step_name = step.name
+        start_time = time.time()
+        attempt = 1
+        try:
+            for name in step.inputs:
+                if not self.__artifacts.is_ready(name):
+                    self.log.info(f'Waiting for "{name}": {task_name}/{step_name}')
+                    self.__emit(
+                        type="step",
+                        task=task_name,
+                        step=step_name,
+                        stage=stage,
+                        state="waiting",
+                    )
+                await self.__artifacts.wait_async(name)
+
+            start_time = self.__step_started(task_name, step_name, stage)
+            while True:
+                attempt_start = time.time()
+                try:
+                    result = await self.__call_step_async(task_name, step)
+                except Exception as e:
+                    delay = self.__attempt_finished(
+                        task_name, step_name, stage, step, attempt, attempt_start, e
+                    )
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    self.__attempt_started(task_name, step_name, stage, attempt)
+                    continue
+
+                self.__attempt_finished(
+                    task_name, step_name, stage, step, attempt, attempt_start
                 )
+                break
+
+            self.__publish(task_name, task, step, result)
+        except asyncio.CancelledError as e:
+            self.__step_finished(task_name, step_name, stage, start_time, e, attempt)
+            raise
+        except Exception as e:
+            self.__step_finished(task_name, step_name, stage, start_time, e, attempt)
+            self.__unpublished(task_name, (step,))
+            if step.quarantined:
+                self.log.warning(
+                    f"Ignoring failure of quarantined step: {task_name}/{step_name}"
+                )
+                return
+            raise
+        self.__step_finished(task_name, step_name, stage, start_time, None, attempt)
+
+    def __task_finished(self, task_name: str, failed: bool) -> None:
+        if failed:
+            with self.__lock:
+                self.__failed.append(task_name)
+        self.__emit(type="task", task=task_name, state="failed" if failed else "done")
+
+    def __run_task(self, task_name: str, task: Task) -> None:
+        self.log.info(f"Running task: {task_name}")
+        self.__emit(type="task", task=task_name, state="running")
+
+        failed = False
+        for i, step in enumerate(task.steps):
+            try:
+                self.__execute_step(task_name, "steps", task, step)
+            except Exception:
+                failed = True
+                self.__unpublished(task_name, task.steps[i + 1 :])
+                break
+
+        for step in task.cleanup:
+            try:
+                self.__execute_step(task_name, "cleanup", task, step)
+            except Exception:
+                pass
+
+        self.__unpublished(task_name, task.steps + task.cleanup)
+        self.__task_finished(task_name, failed)
+
+    async def __run_task_async(self, task_name: str, task: Task) -> None:
+        self.log.info(f"Running task: {task_name}")
+        self.__emit(type="task", task=task_name, state="running")
+
+        failed = False
+        cancelled = None
+        try:
+            for i, step in enumerate(task.steps):
+                try:
+                    await self.__execute_step_async(task_name, "steps", task, step)
+                except Exception:
+                    failed = True
+                    self.__unpublished(task_name, task.steps[i + 1 :])
+                    break
+        except asyncio.CancelledError as e:
+            cancelled = e
+
+        # Cleanup releases the hardware, it also runs after a cancellation and
+        # is shielded from further ones
+        cleanup = asyncio.ensure_future(self.__cleanup_async(task_name, task))
+        while not cleanup.done():
+            try:
+                await asyncio.shield(cleanup)
+            except asyncio.CancelledError as e:
+                cancelled = cancelled or e
+        self.__unpublished(task_name, task.steps + task.cleanup)
+
+        if cancelled is not None:
+            self.__emit(type="task", task=task_name, state="cancelled")
+            raise cancelled
+
+        self.__task_finished(task_name, failed)
+
+    async def __cleanup_async(self, task_name: str, task: Task) -> None:
+        for step in task.cleanup:
+            try:
+                await self.__execute_step_async(task_name, "cleanup", task, step)
+            except Exception:
+                pass
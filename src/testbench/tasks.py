@@ -1,6 +1,8 @@
 from pathlib import Path
 import logging
 
+from .model import FileConfig, Task, ToolConfig
+
 
 class TestbenchTasks:
     def __init__(self, config: dict, tools: dict, files: dict, output_dir: Path):
@@ -12,7 +14,7 @@ class TestbenchTasks:
         self.__output_dir = output_dir
 
         try:
-            self.__tasks = {}
+            self.__tasks: dict[str, Task] = {}
             self.__parse_tasks()
         except Exception as e:
             raise ValueError(f"Error parsing tasks: {e}")
@@ -21,7 +23,7 @@ class TestbenchTasks:
             self.log.warning("No task configurations provided")
         else:
             self.log.info(
-                f"Initialized {len(self.__tasks)} tasks with {sum(len(v['tools']) for v in self.__tasks.values())} tools"
+                f"Initialized {len(self.__tasks)} tasks with {sum(len(v.tools) for v in self.__tasks.values())} tools"
             )
 
     def __parse_tasks(self) -> None:
@@ -70,10 +72,9 @@ class TestbenchTasks:
                     if tool_type not in task_tools:
                         task_tools[tool_type] = {}
 
-                    task_tools[tool_type][tool_name] = {
-                        "name": tool_name,
-                        "params": tool_params,
-                    }
+                    task_tools[tool_type][tool_name] = ToolConfig(
+                        tool_name, tool_params
+                    )
 
             task_files = {}
             if "files" in task:
@@ -93,19 +94,17 @@ class TestbenchTasks:
 
                     file_name = task["files"][file_type].get("name", None)
 
-                    task_files[file_type] = {
-                        "path": file_path,
-                        "configs": file_configs,
-                        "name": file_name,
-                    }
-
-            self.__tasks[task_name] = {
-                "name": task_name,
-                "path": task_path,
-                "output": self.__output_dir / task_name,
-                "tools": task_tools,
-                "files": task_files,
-            }
-
-    def get(self) -> dict:
+                    task_files[file_type] = FileConfig(
+                        file_path, file_configs, file_name
+                    )
+
+            self.__tasks[task_name] = Task(
+                task_name,
+                task_path,
+                self.__output_dir / task_name,
+                task_tools,
+                task_files,
+            )
+
+    def get(self) -> dict[str, Task]:
         return self.__tasks
@@ -1,30 +1,55 @@
 from pathlib import Path
+from concurrent.futures import Executor
+from contextlib import nullcontext, suppress
+import asyncio
+import json
 import time
 import shutil
-from typing import Optional, Any
+from typing import AsyncIterator, Optional, Any
 import logging
 
 from dotenv import load_dotenv, dotenv_values
 import yaml
 import yaml_include
 
-from .common.config import load_config
+from .common.config import load_config, replace_env
 from .tools import TestbenchTools
 from .files import TestbenchFiles
 from .tasks import TestbenchTasks
 from .schedule import TestbenchSchedule
+from .monitor import TestbenchMonitor
+from .profiler import TestbenchProfiler
+from .journal import FileJournal, atomic_write
+from .file import File
+from .cache import TestbenchCache
+from .history import TestbenchHistory
+from .artifacts import TestbenchArtifacts
+from .model import Task, ToolConfig
 
 
 class Testbench:
     def __init__(
-        self, config_path: Path | str, output_dir: Optional[Path | str] = None
+        self,
+        config_path: Path | str,
+        output_dir: Optional[Path | str] = None,
+        env_path: Optional[Path | str] = None,
+        cache: Optional[TestbenchCache] = None,
+        executor: Optional[Executor] = None,
     ):
         self.log = logging.getLogger("testbench")
 
-        yaml.add_constructor("!inc", yaml_include.Constructor(), yaml.SafeLoader)
+        self.__timings: dict[str, float] = {}
+        phase_start = time.perf_counter()
+
+        yaml.add_constructor(
+            "!inc",
+            cache.include if cache else yaml_include.Constructor(),
+            yaml.SafeLoader,
+        )
 
         self.__config_path, self.__config = load_config(config_path)
         self.log.info(f"Testbench: '{self.__config_path}'")
+        phase_start = self.__timed("config", phase_start)
 
         if output_dir:
             self.__output_base_dir = Path(output_dir)
@@ -32,8 +57,17 @@ class Testbench:
             self.__output_base_dir = Path("output")
         self.__output_base_dir.mkdir(parents=True, exist_ok=True)
 
-        self.__output_dir = self.__output_base_dir / time.strftime("%Y%m%d-%H%M%S")
-        self.__output_dir.mkdir()
+        # Testbenches started within the same second get a numbered suffix
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        self.__output_dir = self.__output_base_dir / timestamp
+        suffix = 0
+        while True:
+            try:
+                self.__output_dir.mkdir()
+                break
+            except FileExistsError:
+                suffix += 1
+                self.__output_dir = self.__output_base_dir / f"{timestamp}-{suffix}"
         self.log.info(f"Output directory: '{self.__output_dir}'")
 
         # Copy config file to output directory
@@ -62,30 +96,47 @@ class Testbench:
         with open(self.__output_dir / "config.yml", "w") as f:
             yaml.dump(self.__config, f, default_flow_style=False)
         self.log.debug(f"Copied full config to '{self.__output_dir / 'config.yml'}'")
+        phase_start = self.__timed("output", phase_start)
 
         try:
             self.__env = None
-            self.__handle_env()
+            self.__handle_env(env_path)
         except Exception as e:
             raise ValueError(f"Error setting up environment: {e}")
+        phase_start = self.__timed("env", phase_start)
+
+        try:
+            self.__journal = None
+            self.__handle_journal()
+        except Exception as e:
+            raise ValueError(f"Error setting up file journal: {e}")
+        phase_start = self.__timed("journal", phase_start)
 
         try:
             tools_dir = self.__get("registry/tools")
             if tools_dir is None:
                 raise ValueError("No tools directory found in configuration")
             tools_dir = Path(tools_dir).resolve()
-            self.__tools = TestbenchTools(tools_dir).get()
+            if cache:
+                self.__tools = cache.tools(tools_dir)
+            else:
+                self.__tools = TestbenchTools(tools_dir).get()
         except Exception as e:
             raise ValueError(f"Error setting up tools: {e}")
+        phase_start = self.__timed("tools", phase_start)
 
         try:
             files_dir = self.__get("registry/files")
             if files_dir is None:
                 raise ValueError("No files directory found in configuration")
             files_dir = Path(files_dir).resolve()
-            self.__files = TestbenchFiles(files_dir).get()
+            if cache:
+                self.__files = cache.files(files_dir)
+            else:
+                self.__files = TestbenchFiles(files_dir).get()
         except Exception as e:
             raise ValueError(f"Error setting up files: {e}")
+        phase_start = self.__timed("files", phase_start)
 
         try:
             self.__tasks = TestbenchTasks(
@@ -93,18 +144,63 @@ class Testbench:
             ).get()
         except Exception as e:
             raise ValueError(f"Error setting up tasks: {e}")
+        phase_start = self.__timed("tasks", phase_start)
+
+        try:
+            self.__monitor = None
+            self.__handle_monitor()
+        except Exception as e:
+            raise ValueError(f"Error setting up monitor: {e}")
+        phase_start = self.__timed("monitor", phase_start)
+
+        self.__history = None
+        if self.__config.get("history", True):
+            self.__history = TestbenchHistory(self.__output_base_dir / "history.json")
+        phase_start = self.__timed("history", phase_start)
+
+        try:
+            self.__profiler = None
+            self.__handle_profiler()
+        except Exception as e:
+            raise ValueError(f"Error setting up profiler: {e}")
+        phase_start = self.__timed("profiler", phase_start)
+
+        self.__artifacts = TestbenchArtifacts(self.__output_dir / "artifacts")
+
+        try:
+            self.__quarantine = None
+            self.__handle_quarantine()
+        except Exception as e:
+            raise ValueError(f"Error setting up quarantine: {e}")
+        phase_start = self.__timed("quarantine", phase_start)
 
         try:
             self.__schedule = TestbenchSchedule(
                 self.__get("schedule"),
                 self.__tools,
                 self.__tasks,
+                [
+                    listener.update
+                    for listener in (self.__monitor, self.__history)
+                    if listener is not None
+                ],
+                self.__profiler,
+                executor,
+                self.__artifacts,
+                self.__quarantine and set(self.__quarantine["steps"]),
+                self.__quarantine["action"] if self.__quarantine else "quarantine",
             )
         except Exception as e:
             raise ValueError(f"Error setting up schedule: {e}")
+        self.__timed("schedule", phase_start)
 
         self.log.info("Initialized testbench")
 
+    def __timed(self, phase: str, start: float) -> float:
+        now = time.perf_counter()
+        self.__timings[phase] = now - start
+        return now
+
     def __get(self, key: str) -> Any:
         if "/" not in key:
             if key not in self.__config:
@@ -121,36 +217,89 @@ class Testbench:
                 raise KeyError(f'Key "{keys[-1]}" not found in configuration')
             return temp[keys[-1]]
 
-    def __handle_env(self):
+    def __handle_env(self, env_path: Optional[Path | str] = None):
         self.log.debug("Handling environment variables")
 
-        load_dotenv()
-        self.__env = dotenv_values()
+        load_dotenv(env_path)
+        self.__env = dotenv_values(env_path)
 
         # Place environment into output directory
         with open(self.__output_dir / ".env", "w") as f:
             for key, value in self.__env.items():
                 f.write(f"{key}={value}\n")
 
-        def replace_env(obj, env: dict):
-            if isinstance(obj, dict):
-                for key, value in obj.items():
-                    obj[key] = replace_env(value, env)
-            elif isinstance(obj, list):
-                for i, value in enumerate(obj):
-                    obj[i] = replace_env(value, env)
-            elif isinstance(obj, str):
-                for key, value in env.items():
-                    obj = obj.replace(f"<{key.lower()}>", value)
-
-            return obj
-
         self.log.debug(f"Set up {len(self.__env)} environment variables")
 
         self.__config = replace_env(self.__config, self.__env)
 
+    def __handle_journal(self) -> None:
+        journal_path = self.__output_base_dir / "journal.json"
+        transaction = self.__config.get("transaction", False)
+        if not transaction and not journal_path.exists():
+            return
+
+        journal = FileJournal(journal_path)
+        journal.recover()
+
+        if transaction:
+            self.__journal = journal
+            self.log.info(f"File transactions journaled in '{journal_path}'")
+
+    def __handle_monitor(self) -> None:
+        monitor_config = self.__config.get("monitor")
+        if not monitor_config:
+            return
+        if monitor_config is True:
+            monitor_config = {}
+
+        self.__monitor = TestbenchMonitor(
+            monitor_config.get("host", "127.0.0.1"), monitor_config.get("port", 0)
+        )
+        self.__monitor.start()
+
+    def __handle_profiler(self) -> None:
+        profile_config = self.__config.get("profile")
+        if not profile_config:
+            return
+        if profile_config is True:
+            profile_config = {}
+
+        self.__profiler = TestbenchProfiler(
+            cprofile=profile_config.get("cprofile", True),
+            memory=profile_config.get("tracemalloc", False),
+            tasks=profile_config.get("tasks"),
+            steps=profile_config.get("steps"),
+            top=profile_config.get("top", 20),
+        )
+        self.log.info("Profiling enabled")
+
+    def __handle_quarantine(self) -> None:
+        quarantine_config = self.__config.get("quarantine")
+        if not quarantine_config:
+            return
+        if quarantine_config is True:
+            quarantine_config = {}
+
+        if self.__history is None:
+            raise ValueError("Quarantine requires the history to be enabled")
+
+        action = quarantine_config.get("action", "quarantine")
+        if action not in ("quarantine", "defer"):
+            raise ValueError(f'Unknown quarantine action "{action}"')
+
+        steps = self.__history.flaky(
+            quarantine_config.get("threshold", 0.2),
+            quarantine_config.get("runs", 10),
+            quarantine_config.get("min_runs", 3),
+        )
+        for step, rate in steps.items():
+            self.log.warning(f"Flaky step ({rate:.0%} failed): {step}")
+
+        self.__quarantine = {"steps": steps, "action": action}
+
     def initialize_tasks(self) -> None:
         self.log.debug("Initializing tasks")
+        phase_start = time.perf_counter()
 
         for task_name in self.__tasks:
             self.log.debug(f"Initializing task: {task_name}")
@@ -159,73 +308,165 @@ class Testbench:
 
             # Instantiate file classes
             # TODO: Only initialize files needed in steps
-            for file in task["files"]:
+            files = {}
+            for file in task.files:
                 file_cls = self.__files[file]["cls"]
-                file_path = task["files"][file]["path"]
-                file_configs = task["files"][file]["configs"]
-                file_name = task["files"][file]["name"]
-                file_instance = file_cls(
-                    file_path,
-                    file_configs,
-                    self.__output_dir / task_name,
-                    file_name,
-                )
-                task["files"][file] = file_instance
+                file_config = task.files[file]
+                file_output_dir = self.__output_dir / task_name
+
+                def create_file():
+                    return file_cls(
+                        file_config.path,
+                        file_config.configs,
+                        file_output_dir,
+                        file_config.name,
+                    )
+
+                with self.__journal.active() if self.__journal else nullcontext():
+                    if self.__profiler and self.__profiler.matches(
+                        task_name, f"file/{file}"
+                    ):
+                        files[file] = self.__profiler.run(
+                            create_file,
+                            f"{task_name}/file/{file}",
+                            file_output_dir / "files" / file,
+                        )
+                    else:
+                        files[file] = create_file()
+            task.files = files
 
             # Instantiate only tools referenced in the schedule steps
-            needed_tools = {
-                (step["type"], step["tool"]) for step in task.get("steps", [])
+            tools = {
+                tool_type: dict(configs) for tool_type, configs in task.tools.items()
             }
-            for tool_type, tool_name in needed_tools:
+            for step in task.steps + task.cleanup:
+                tool_config = tools[step.type][step.tool]
+                if not isinstance(tool_config, ToolConfig):
+                    continue
+
                 self.log.debug(
-                    f"Initializing tool: {tool_type}/{tool_name} for task: {task_name}"
+                    f"Initializing tool: {step.type}/{step.tool} for task: {task_name}"
                 )
-
-                tool_info = task["tools"][tool_type][tool_name]
-                if not tool_info:
-                    raise KeyError(
-                        f'Tool type "{tool_type}" not configured in task "{task_name}"'
-                    )
-                tool_name = tool_info["name"]
-                tool_params = tool_info["params"]
-                tool_cls = self.__tools[tool_type][tool_name]["cls"]
+                tool_cls = self.__tools[step.type][tool_config.name]["cls"]
                 try:
-                    tool_instance = tool_cls(task, tool_params, self.__env)
+                    tools[step.type][step.tool] = tool_cls(
+                        task, dict(tool_config.params), self.__env
+                    )
                 except Exception as e:
                     raise Exception(
-                        f"Error initializing tool {tool_type}/{tool_name} for task {task_name}: {e}"
+                        f"Error initializing tool {step.type}/{step.tool} for task {task_name}: {e}"
                     ) from e
+            task.tools = tools
 
-                task["tools"][tool_type][tool_name] = tool_instance
-
-                for step in task.get("steps", []):
-                    if step["type"] == tool_type and step["tool"] == tool_name:
-                        step["tool_instance"] = tool_instance
-
-                        # get function from tool class
-                        tool_func = getattr(tool_instance, step["func"])
-                        step["func_instance"] = tool_func
+            # Bind the step functions once, the schedule only calls them
+            task.steps = tuple(
+                step.replace(call=getattr(tools[step.type][step.tool], step.func))
+                for step in task.steps
+            )
+            task.cleanup = tuple(
+                step.replace(call=getattr(tools[step.type][step.tool], step.func))
+                for step in task.cleanup
+            )
+            task.freeze()
 
         self.log.info(
-            f"Initialized {len(self.__tasks)} tasks with {sum(len(v['files']) for v in self.__tasks.values())} files and {sum(len(v['tools']) for v in self.__tasks.values())} tools"
+            f"Initialized {len(self.__tasks)} tasks with {sum(len(v.files) for v in self.__tasks.values())} files and {sum(len(v.tools) for v in self.__tasks.values())} tools"
         )
+        self.__timed("initialize_tasks", phase_start)
 
-    def get_tasks(self) -> dict:
+    def get_tasks(self) -> dict[str, Task]:
         return self.__tasks
 
+    def restore_files(self) -> None:
+        self.log.debug("Restoring files")
+        for task in self.__tasks.values():
+            for file in task.files.values():
+                if isinstance(file, File):
+                    file.restore()
+
+    def __enter__(self) -> "Testbench":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.restore_files()
+
+        if self.__monitor is not None:
+            self.__monitor.stop()
+
     def __del__(self) -> None:
-        if hasattr(self, "__tasks"):
-            self.log.debug("Cleaning up files")
-            for task_name in self.__tasks:
-                task = self.__tasks[task_name]
-                for file in list(task["files"].keys()):
-                    del task["files"][file]
+        if getattr(self, "_Testbench__monitor", None) is not None:
+            self.__monitor.stop()
+
+    def __handle_done(self) -> None:
+        if self.__history and self.__schedule.is_done():
+            self.__history.save()
+
+        if self.__schedule.is_done():
+            attempts = json.dumps(self.__schedule.get_attempts(), indent=2)
+            atomic_write(self.__output_dir / "attempts.json", attempts)
+
+        if self.__profiler and self.__schedule.is_done():
+            self.__profiler.write_summary(self.__output_dir / "profile_summary.txt")
+            self.__profiler.close()
 
     def iterate(self) -> None:
         self.__schedule.iterate()
+        self.__handle_done()
+
+    async def iterate_async(self) -> None:
+        await self.__schedule.iterate_async()
+        self.__handle_done()
+
+    async def run(self) -> list[str]:
+        while not self.__schedule.is_done():
+            await self.iterate_async()
+        return self.get_failed()
+
+    async def events(self) -> AsyncIterator[dict]:
+        """
+        Run the schedule on the current event loop and yield its task and step
+        events. Leaving the iteration early cancels the run.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[Optional[dict]] = asyncio.Queue()
+
+        def listener(event: dict) -> None:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        self.__schedule.add_listener(listener)
+        run = asyncio.ensure_future(self.run())
+        run.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            await run
+        finally:
+            self.__schedule.remove_listener(listener)
+            if not run.done():
+                run.cancel()
+                with suppress(asyncio.CancelledError):
+                    await run
 
     def is_done(self) -> bool:
         return self.__schedule.is_done()
 
+    def get_failed(self) -> list[str]:
+        return list(self.__schedule.get_failed())
+
     def get_output_dir(self) -> Path:
         return self.__output_dir
+
+    def get_timings(self) -> dict[str, float]:
+        return self.__timings
+
+    def get_monitor(self) -> Optional[TestbenchMonitor]:
+        return self.__monitor
+
+    def get_profiler(self) -> Optional[TestbenchProfiler]:
+        return self.__profiler
+
+    def get_artifacts(self) -> TestbenchArtifacts:
+        return self.__artifacts
+
+    def get_quarantine(self) -> dict[str, float]:
+        return self.__quarantine["steps"] if self.__quarantine else {}
@@ -1,15 +1,22 @@
+from pathlib import Path
+import asyncio
+import os
+import signal
 import subprocess
+import threading
 import time
 from typing import Any, Optional
 import logging
 
+from .model import Task
+
 
 class Tool:
     def __init__(
         self,
         type: str,
         name: str,
-        task: dict,
+        task: Task,
         params: dict,
         env: dict,
     ):
@@ -21,14 +28,17 @@ class Tool:
 
         self.log = logging.getLogger(f"tool.{self.type}.{self.type_name}")
 
-        self.task_path = self.task["path"]
-        self.task_name = self.task["name"]
-        self.task_output = self.task["output"]
+        self.task_path = self.task.path
+        self.task_name = self.task.name
+        self.task_output = self.task.output
 
         self.output_dir = self.task_output / f"{self.type}_{self.type_name}"
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-    def run_command(self, command: str, type: str) -> None:
+        self.__processes: set[subprocess.Popen] = set()
+        self.__processes_lock = threading.Lock()
+
+    def __prepare_output(self, command: str, type: str) -> tuple[Path, Path]:
         self.log.debug(f"Running {type} command: '{command}'")
 
         stdout_file = (
@@ -51,9 +61,16 @@ class Tool:
             stderr.write(f"Time: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
             stderr.write("-" * 45 + "\n\n")
 
+        return stdout_file, stderr_file
+
+    def run_command(self, command: str, type: str) -> None:
+        stdout_file, stderr_file = self.__prepare_output(command, type)
+
         result = None
         try:
             with open(stdout_file, "a") as stdout, open(stderr_file, "a") as stderr:
+                # Own process group, so killing it also kills the children of
+                # the shell
                 result = subprocess.Popen(
                     command,
                     stdout=stdout,
@@ -61,8 +78,19 @@ class Tool:
                     shell=True,
                     errors="ignore",
                     encoding="utf-8",
+                    start_new_session=True,
                 )
-                result.communicate()
+                with self.__processes_lock:
+                    self.__processes.add(result)
+                try:
+                    result.communicate()
+                except BaseException:
+                    self.__kill(result.pid)
+                    result.wait()
+                    raise
+                finally:
+                    with self.__processes_lock:
+                        self.__processes.discard(result)
 
                 if result.returncode != 0:
                     raise Exception(
@@ -74,6 +102,47 @@ class Tool:
                 stdout, stderr = result.communicate()
             raise Exception(f"{type} command timed out")
 
+    async def run_command_async(self, command: str, type: str) -> None:
+        stdout_file, stderr_file = self.__prepare_output(command, type)
+
+        with open(stdout_file, "a") as stdout, open(stderr_file, "a") as stderr:
+            result = await asyncio.create_subprocess_shell(
+                command, stdout=stdout, stderr=stderr, start_new_session=True
+            )
+            try:
+                await result.wait()
+            except asyncio.CancelledError:
+                self.__kill(result.pid)
+                await result.wait()
+                raise
+
+        if result.returncode != 0:
+            raise Exception(f"{type} command failed with code {result.returncode}")
+
+    def kill_commands(self) -> None:
+        """
+        Kill the commands currently started by `run_command`, e.g. when the step
+        running them timed out.
+        """
+        with self.__processes_lock:
+            processes = list(self.__processes)
+        for process in processes:
+            if process.poll() is None:
+                self.log.warning(f"Killing command: '{process.args}'")
+                self.__kill(process.pid)
+
+    @staticmethod
+    def __kill(pid: int) -> None:
+        try:
+            if os.name == "nt":
+                subprocess.run(
+                    ["taskkill", "/T", "/F", "/PID", str(pid)], capture_output=True
+                )
+            else:
+                os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
     def ensure(self, loc: str, variable: str, default: Optional[Any] = None) -> Any:
         match loc:
             case "env":
@@ -101,12 +170,21 @@ class Tool:
                 return self.params[variable]
 
             case "file":
-                if variable not in self.task["files"]:
+                if variable not in self.task.files:
                     raise Exception(
                         f"Tool {self.type}/{self.type_name} for {self.task_name} requires {variable} in files"
                     )
 
-                return self.task["files"][variable]
+                return self.task.files[variable]
+
+            case "artifact":
+                # Steps wait for their declared inputs, so these are published
+                try:
+                    return self.task.artifacts.get(variable)
+                except Exception as e:
+                    raise Exception(
+                        f"Tool {self.type}/{self.type_name} for {self.task_name} requires artifact {variable}: {e}"
+                    )
 
             case _:
                 raise Exception(f"Unknown location: {loc}")